@@ -1,465 +1,572 @@
-import pandas as pd
-import streamlit as st
-import plotly.express as px
-from datetime import datetime
-import plotly.graph_objects as go
-
-
-st.set_page_config(
-    page_title="Claim Leakage Dashboard Testing",
-    page_icon="🏂",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
-st.markdown("""
-    <style>
-        /* General body background color */
-        body {
-            background-color: #f0f0f0;
-        }
-        /* Sidebar custom styling */
-        .sidebar .sidebar-content {
-            background-color: #ffffff;
-        }
-        /* Input fields in sidebar */
-        .css-1to6prn input {
-            border: 2px solid #5d3a9b;
-            background-color: #f8f8f8;
-            color: #333333;
-            padding: 10px;
-        }
-        /* Sidebar header styling */
-        .css-1to6prn label {
-            color: #5d3a9b;
-        }
-        /* Title and Subheader text color */
-        .css-ffhzg2 {
-            color: #5d3a9b;
-        }
-        /* Button Styling */
-        .css-1v3fvcr button {
-            background-color: #5d3a9b;
-            color: white;
-            border-radius: 5px;
-        }
-        /* Styling for Metric Cards */
-        .css-1v3fvcr {
-            background-color: #5d3a9b;
-            color: white;
-            border-radius: 5px;
-        }
-        /* Change background of the filters */
-        .stTextInput {
-            background-color: #e0e0e0;
-            border-radius: 8px;
-            padding: 10px;
-            border: 2px solid #5d3a9b;
-        }
-        /* Metric card styling */
-        .stMetric {
-            background-color: #ffffff;
-            border: 2px solid #5d3a9b;
-            padding: 15px;
-            border-radius: 8px;
-        }
-        /* Styling for the multiselect input */
-        .stMultiSelect {
-            background-color: #e0e0e0;
-            border-radius: 8px;
-            padding: 10px;
-            border: 2px solid #5d3a9b;
-        }
-        /* Change text color and border of selected items */
-        .stMultiSelect input {
-            color: #5d3a9b;
-            background-color: #f8f8f8;
-            padding: 8px;
-        }
-        /* Styling for the dropdown options */
-        div[role="listbox"] {
-            background-color: #f8f8f8; /* Background color of the dropdown */
-            border: 2px solid #5d3a9b; /* Border color of the dropdown */
-            border-radius: 8px;
-            padding: 8px;
-        }
-        /* Change selected option in the dropdown */
-        div[role="option"][aria-selected="true"] {
-            background-color: #5d3a9b; /* Background color when an option is selected */
-            color: white; /* Text color of the selected option */
-        }
-        /* Optional: Change unselected options background color */
-        div[role="option"]:not([aria-selected="true"]) {
-            background-color: #e0e0e0; /* Light gray for unselected options */
-            color: #5d3a9b; /* Border color for unselected options */
-        }
-        /* Styling for the multiselect input */
-        .stDateInput {
-            background-color: #e0e0e0;
-            border-radius: 8px;
-            padding: 10px;
-            border: 2px solid #5d3a9b;
-        }
-        /* Change text color, background color, and border of the selected item */
-        .stDateInput input {
-            color: #5d3a9b; /* Text color same as border color */
-            background-color: #f8f8f8;
-            padding: 8px;
-        }
-        .stDateInput input::placeholder {
-            color: #5d3a9b; /* Match placeholder text color with the border */
-        }
-    </style>
-""", unsafe_allow_html=True)
-
-# Function to fetch data from the claims table in PostgreSQL
-def fetch_claims_data():
-    try:
-        # # Database connection parameters
-        # conn = psycopg2.connect(
-        #     dbname="postgres",
-        #     user="postgres",
-        #     password="1234",
-        #     host="localhost",
-        #     port="5432"
-        # )
-        
-        # # SQL query to fetch data
-        # query = "SELECT * FROM claim_details limit 200000"
-        
-        # Fetch data and load it into a Pandas DataFrame
-        df = pd.read_csv("Claims.csv")
-        
-        # Ensure date columns are in the correct format
-        date_columns = [
-            'claim_received_date', 'claim_loss_date', 'claim_finalised_date',
-            'original_verified_date_of_loss_time', 'last_verified_date_of_loss_time',
-            'catastrophe_valid_from_date_time', 'catastrophe_valid_to_date_time', 'update_date'
-        ]
-        for col in date_columns:
-            if col in df.columns:
-                df[col] = pd.to_datetime(df[col], errors='coerce').dt.date
-        
-    except Exception as e:
-        print(f"Error fetching data: {e}")
-        df = pd.DataFrame()  # Return empty DataFrame on failure
-    
-    
-    return df
-
-# Streamlit app for the report with independent filters and charts
-def main():
-    # Initialize session state for date filters
-    if "date_filters" not in st.session_state:
-        data = fetch_claims_data()
-        date_columns = [
-            'claim_received_date', 'claim_loss_date', 'claim_finalised_date', 
-            'original_verified_date_of_loss_time', 'last_verified_date_of_loss_time', 
-            'catastrophe_valid_from_date_time', 'catastrophe_valid_to_date_time'
-        ]
-        st.session_state.date_filters = {
-            col: (data[col].min(), data[col].max()) 
-            for col in date_columns
-        }
-
-    # Display logo
-    st.image("exl.png", width=150)
-    st.title("Claim Report Dashboard Testing")
-
-    # Fetch data from the database
-    data = fetch_claims_data()
-
-    if not data.empty:
-        # Sidebar for filters
-        st.sidebar.header("Filter Options")
-
-        # Initialize session state for filters
-        if 'claim_numbers' not in st.session_state:
-            params = st.query_params
-            st.session_state.claim_numbers = params.get('claim_numbers', '')
-
-        # Apply claim number filter
-        claim_numbers = st.sidebar.text_input(
-            "Filter by Claim Number (comma-separated)", 
-            value=st.session_state.claim_numbers
-        )
-        st.session_state.claim_numbers = claim_numbers
-
-        if claim_numbers:
-            claim_numbers = [num.strip() for num in claim_numbers.split(",") if num.strip()]
-            filtered_data = data[data['claim_number'].astype(str).isin(claim_numbers)]
-        else:
-            filtered_data = data.copy()
-
-        # Text-based filters with an "All" option for each relevant column
-        text_columns = [
-            'source_system', 'general_nature_of_loss', 'line_of_business', 'claim_status', 
-            'fault_rating', 'fault_categorisation'
-        ]
-
-        # Initialize text filters in session state if not present
-        if 'text_filters' not in st.session_state:
-            params = st.query_params
-            st.session_state.text_filters = {
-                col: params.get(col, ['All']) 
-                for col in text_columns
-            }
-
-        # Apply text-based filters
-        for col in text_columns:
-            unique_values = data[col].dropna().unique().tolist()
-            unique_values.insert(0, "All")  # Add "All" option
-            selected_values = st.sidebar.multiselect(
-                f"Filter by {col}", 
-                options=unique_values, 
-                default=st.session_state.text_filters[col]
-            )
-            st.session_state.text_filters[col] = selected_values
-            
-            # Apply filter only if "All" is not selected
-            if "All" not in selected_values:
-                filtered_data = filtered_data[filtered_data[col].isin(selected_values)]
-
-        # Independent Date range filters
-        date_columns = [
-            'claim_received_date', 'claim_loss_date', 'claim_finalised_date', 
-            'original_verified_date_of_loss_time', 'last_verified_date_of_loss_time', 
-            'catastrophe_valid_from_date_time', 'catastrophe_valid_to_date_time'
-        ]
-        for col in date_columns:
-            min_date, max_date = st.session_state.date_filters[col]
-            date_range = st.sidebar.date_input(f"{col} Range", value=(min_date, max_date))
-            st.session_state.date_filters[col] = date_range
-            if date_range:
-                filtered_data = filtered_data[filtered_data[col].between(date_range[0], date_range[1])]
-
-        # Display filtered statistics
-        st.markdown("""
-            <style>
-                h3 {
-                    color: #5d3a9b !important;
-                }
-            </style>
-        """, unsafe_allow_html=True)
-        st.subheader("Filtered Claims Statistics")
-        st.write("Total Claims:", filtered_data["claim_number"].nunique())
-
-        def display_custom_metric(title, value, background_color="#f0f0f0"):
-            card_style = f"""
-            <style>
-            .metric-card {{
-                border: 2px solid #5d3a9b;
-                border-radius: 8px;
-                background-color: {background_color};
-                padding: 20px;
-                margin: 10px;
-                height: 200px;  
-                width: 160px;
-                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-            }}
-            .metric-card h3 {{
-                color: #5d3a9b;
-                font-size: 18px;
-                margin-bottom: 10px;
-            }}
-            .metric-card .value {{
-                font-size: 36px;
-                font-weight: bold;
-                color: #333;
-                margin-bottom: 0px;
-            }}
-            </style>
-            """
-
-            # HTML for the metric card
-            card_html = f"""
-            <div class="metric-card">
-                <h3>{title}</h3>
-                <div class="value">{value}</div>
-            </div>
-            """
-
-            # Render the card with custom styling
-            st.markdown(card_style + card_html, unsafe_allow_html=True)
-        
-        st.subheader("Metrics Overview")
-        col1, col2, col3, col4, col5, col6 = st.columns(6)
-        
-        with col1:
-            display_custom_metric("Claims Monitored", "3,071")
-        with col2:
-            display_custom_metric("Claims with Leakage Opportunity", "1,854")
-
-        with col3:
-            def display_gauge_in_metric_card(title, gauge_value, background_color="#f0f0f0"):
-                if not isinstance(gauge_value, (int, float)):
-                    raise ValueError("gauge_value must be a numeric type.")
-
-                card_style = f"""
-                <style>
-                .gauge-card {{
-                    border: 2px solid #5d3a9b;
-                    border-radius: 8px;
-                    background-color: {background_color};
-                    padding: 20px;
-                    margin: 10px;
-                    box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
-                    height: 400px;  /* Fixed height for all cards */
-                    width: 300px;   /* Fixed width for all cards */
-                    display: flex;
-                    flex-direction: column;
-                    align-items: center;
-                    text-align: center;
-                    justify-content: space-between;
-                }}
-                .gauge-card h3 {{
-                    color: #5d3a9b;
-                    font-size: 18px;
-                    margin-bottom: 10px;
-                }}
-                </style>
-                """
-
-                fig = go.Figure(go.Indicator(
-                    mode="gauge+number",
-                    value=gauge_value,
-                    gauge={'axis': {'range': [0, 100]}, 'bar': {'color': "#5d3a9b"}},
-                    title={'text': f"{title} (%)", 'font': {'size': 16, 'color': 'black'}},
-                    domain={'x': [0, 1], 'y': [0, 1]}
-                ))
-                fig.update_layout(height=170, margin=dict(t=0, b=0, l=0, r=0))
-
-                with st.container():
-                    st.markdown(card_style, unsafe_allow_html=True)
-                    st.markdown(f"<div class='gauge-card'><h3>{title}</h3></div>", unsafe_allow_html=True)
-                    st.plotly_chart(fig, use_container_width=True)
-
-            display_custom_metric("Leakage Opportunity %", 60)
-
-        with col4:
-            display_custom_metric("Potential Leakage $", "$51.2M")
-
-        with col5:
-            display_custom_metric("Leakage Rate %", 100)
-
-        with col6:
-            display_custom_metric("Opportunities Not Actioned", "3,063")
-        
-        st.markdown("<br><br>", unsafe_allow_html=True)
-        col1, col2 = st.columns(2, gap="small")
-
-        with col1:
-            st.subheader("Claims by Status")
-            status_counts = filtered_data['claim_status'].value_counts().reset_index()
-            status_counts.columns = ['claim_status', 'count']
-            fig_status = px.bar(
-                status_counts, x='claim_status', y='count', title="Claims by Status", 
-                color='claim_status', color_discrete_sequence=px.colors.sequential.Plasma
-            )
-            fig_status.update_layout(
-                plot_bgcolor="#ffffff",
-                paper_bgcolor="#f0f2f6",
-            )
-            st.plotly_chart(fig_status)
-
-        with col2:
-            st.subheader("Claims Over Time")
-            claims_over_time = filtered_data.groupby('claim_received_date').size().reset_index(name='claim_count')
-            fig_time = px.line(
-                claims_over_time, x='claim_received_date', y='claim_count', 
-                title="Claims Over Time", color_discrete_sequence=px.colors.sequential.Viridis
-            )
-            fig_time.update_layout(
-                plot_bgcolor="#ffffff",
-                paper_bgcolor="#f0f2f6",
-            )
-            st.plotly_chart(fig_time)
-
-        col3, col4 = st.columns(2, gap="small")
-
-        with col3:
-            st.subheader("Claim Status Distribution")
-            fig_pie = px.pie(filtered_data, names='claim_status', title="Claim Status Distribution", hole=0.3)
-            fig_pie.update_layout(
-                plot_bgcolor="#ffffff",
-                paper_bgcolor="#f0f2f6",
-            )
-            st.plotly_chart(fig_pie)
-
-        with col4:
-            st.subheader("Claims by Line of Business")
-            line_of_business_counts = filtered_data['line_of_business'].value_counts().reset_index()
-            line_of_business_counts.columns = ['line_of_business', 'count']
-            fig_line_of_business = px.bar(
-                line_of_business_counts, 
-                y='line_of_business', 
-                x='count', 
-                orientation='h', 
-                title="Claims by Line of Business", 
-                color='line_of_business'
-            )
-            fig_line_of_business.update_layout(
-                plot_bgcolor="#ffffff",
-                paper_bgcolor="#f0f2f6",
-                showlegend=False,
-            )
-            fig_line_of_business.update_xaxes(title="Count")
-            fig_line_of_business.update_yaxes(title="Line of Business")
-            st.plotly_chart(fig_line_of_business)
-            
-        st.subheader("Claim Status Trend Over Months")
-        filtered_data['claim_received_date'] = pd.to_datetime(filtered_data['claim_received_date'], errors='coerce')
-        filtered_data['month_year'] = filtered_data['claim_received_date'].dt.to_period('M').astype(str)
-        monthly_status_counts = (
-            filtered_data.groupby(['month_year', 'claim_status'])
-            .size()
-            .reset_index(name='count')
-        )
-
-        fig_trend_monthly = px.bar(
-            monthly_status_counts, 
-            x='month_year', 
-            y='count', 
-            color='claim_status', 
-            title="Monthly Claim Status Trend (Open vs Closed)",
-            barmode='group'
-        )
-
-        monthly_totals = monthly_status_counts.groupby('month_year')['count'].sum().reset_index()
-        fig_trend_monthly.add_scatter(
-            x=monthly_totals['month_year'], 
-            y=monthly_totals['count'], 
-            mode='lines+markers', 
-            name='Total Claims Trend',
-            line=dict(color='blue', width=2)
-        )
-
-        fig_trend_monthly.update_layout(
-            plot_bgcolor="#ffffff",
-            paper_bgcolor="#f0f2f6",
-            xaxis_title="Month-Year",
-            yaxis_title="Number of Claims",
-            xaxis_tickangle=-45
-        )
-        st.plotly_chart(fig_trend_monthly)
-        
-        st.subheader("Filtered Claims Data")
-        filtered_data = filtered_data.head(20)
-
-        def style_alternate_rows(x):
-            style = pd.DataFrame('', index=x.index, columns=x.columns)
-            style.iloc[::2] = 'background-color: #f9f9f9'  # Light gray for even rows
-            style.iloc[1::2] = 'background-color: #e6e6e6'  # Slightly darker gray for odd rows
-            return style
-
-        styled_df = filtered_data.style.apply(style_alternate_rows, axis=None)
-        st.dataframe(styled_df)
-
-        csv = filtered_data.to_csv(index=False)
-        st.download_button("Download as CSV", csv, "filtered_claims.csv", "text/csv")
-        
-    else:
-        st.warning("No data available.")
-
-if __name__ == "__main__":
-    main()
+import numpy as np
+import pandas as pd
+import streamlit as st
+from datetime import datetime
+import plotly.graph_objects as go
+from claims_data import DATE_COLUMNS, FILTER_DATE_COLUMNS, TEXT_FILTER_COLUMNS
+from claims_filters import FilterState, sort_cache
+from claims_export import EXPORT_FORMATS, export_bytes, export_file_name, export_mime
+from claims_aggregates import aggregate_cache, aggregate_key
+from claims_charts import cached_figure, figure_cache
+from claims_sources import get_claims_source
+from claims_instrumentation import INSTRUMENT, instrumented_rerun, stage, timing_rows
+from claims_api import export_url, record_view, start_claims_api, warmer
+
+
+st.set_page_config(
+    page_title="Claim Leakage Dashboard Testing",
+    page_icon="🏂",
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+st.markdown("""
+    <style>
+        /* General body background color */
+        body {
+            background-color: #f0f0f0;
+        }
+        /* Sidebar custom styling */
+        .sidebar .sidebar-content {
+            background-color: #ffffff;
+        }
+        /* Input fields in sidebar */
+        .css-1to6prn input {
+            border: 2px solid #5d3a9b;
+            background-color: #f8f8f8;
+            color: #333333;
+            padding: 10px;
+        }
+        /* Sidebar header styling */
+        .css-1to6prn label {
+            color: #5d3a9b;
+        }
+        /* Title and Subheader text color */
+        .css-ffhzg2 {
+            color: #5d3a9b;
+        }
+        /* Button Styling */
+        .css-1v3fvcr button {
+            background-color: #5d3a9b;
+            color: white;
+            border-radius: 5px;
+        }
+        /* Styling for Metric Cards */
+        .css-1v3fvcr {
+            background-color: #5d3a9b;
+            color: white;
+            border-radius: 5px;
+        }
+        /* Change background of the filters */
+        .stTextInput {
+            background-color: #e0e0e0;
+            border-radius: 8px;
+            padding: 10px;
+            border: 2px solid #5d3a9b;
+        }
+        /* Metric card styling */
+        .stMetric {
+            background-color: #ffffff;
+            border: 2px solid #5d3a9b;
+            padding: 15px;
+            border-radius: 8px;
+        }
+        /* Styling for the multiselect input */
+        .stMultiSelect {
+            background-color: #e0e0e0;
+            border-radius: 8px;
+            padding: 10px;
+            border: 2px solid #5d3a9b;
+        }
+        /* Change text color and border of selected items */
+        .stMultiSelect input {
+            color: #5d3a9b;
+            background-color: #f8f8f8;
+            padding: 8px;
+        }
+        /* Styling for the dropdown options */
+        div[role="listbox"] {
+            background-color: #f8f8f8; /* Background color of the dropdown */
+            border: 2px solid #5d3a9b; /* Border color of the dropdown */
+            border-radius: 8px;
+            padding: 8px;
+        }
+        /* Change selected option in the dropdown */
+        div[role="option"][aria-selected="true"] {
+            background-color: #5d3a9b; /* Background color when an option is selected */
+            color: white; /* Text color of the selected option */
+        }
+        /* Optional: Change unselected options background color */
+        div[role="option"]:not([aria-selected="true"]) {
+            background-color: #e0e0e0; /* Light gray for unselected options */
+            color: #5d3a9b; /* Border color for unselected options */
+        }
+        /* Styling for the multiselect input */
+        .stDateInput {
+            background-color: #e0e0e0;
+            border-radius: 8px;
+            padding: 10px;
+            border: 2px solid #5d3a9b;
+        }
+        /* Change text color, background color, and border of the selected item */
+        .stDateInput input {
+            color: #5d3a9b; /* Text color same as border color */
+            background-color: #f8f8f8;
+            padding: 8px;
+        }
+        .stDateInput input::placeholder {
+            color: #5d3a9b; /* Match placeholder text color with the border */
+        }
+    </style>
+""", unsafe_allow_html=True)
+
+# Claims source for this process: Claims.csv, loaded once and shared by every
+# session, or the claims table of the database named by CLAIMS_DATABASE_URL
+def fetch_claims_data():
+    try:
+        with stage('load'):
+            source = get_claims_source()
+            row_count = source.row_count
+        if not row_count:
+            source = None
+
+    except Exception as e:
+        print(f"Error fetching data: {e}")
+        source = None  # No data on failure
+
+
+    return source
+
+# Sidebar panel with load metrics for the claims source and a manual reload hook
+def display_dataset_panel(source):
+    with st.sidebar.expander("Dataset"):
+        metrics = source.metrics()
+        st.write("Source:", metrics['source'])
+        st.write("Rows:", f"{metrics['rows']:,}")
+        if 'memory_bytes' in metrics:
+            memory_label = "Memory (shared):" if metrics.get('shared') else "Memory:"
+            st.write(memory_label, f"{metrics['memory_bytes'] / 1024 ** 2:.1f} MB")
+            st.write("Load time:", f"{metrics['load_seconds']:.2f} s")
+        if 'pool' in metrics:
+            pool = metrics['pool']
+            st.write("Connections:", f"{pool['open']} open / {pool['size']}, {pool['idle']} idle")
+        st.write("Version:", metrics['version'], "loaded at", metrics['loaded_at'])
+        if metrics.get('high_water_mark'):
+            st.write("Updated up to:", metrics['high_water_mark'][:10])
+        cache_stats = aggregate_cache.stats()
+        st.write(
+            "Aggregate cache:", f"{cache_stats['hits']} hits / {cache_stats['misses']} misses,",
+            f"{cache_stats['entries']} entries"
+        )
+        figure_stats = figure_cache.stats()
+        st.write(
+            "Figure cache:", f"{figure_stats['hits']} hits / {figure_stats['misses']} misses,",
+            f"{figure_stats['entries']} figures, {figure_stats['bytes'] / 1024 ** 2:.1f} MB"
+        )
+        sort_stats = sort_cache.stats()
+        st.write(
+            "Sort cache:", f"{sort_stats['hits']} hits / {sort_stats['misses']} misses,",
+            f"{sort_stats['entries']} arrays, {sort_stats['bytes'] / 1024 ** 2:.1f} MB"
+        )
+        if getattr(source, 'delta_source', None) and st.button("Refresh changes"):
+            try:
+                changed, added = source.refresh()
+                st.session_state.refresh_result = f"{changed:,} claims updated, {added:,} added"
+            except Exception as e:
+                print(f"Error refreshing data: {e}")
+                st.session_state.refresh_result = f"Refresh failed: {e}"
+            st.rerun()
+        if st.session_state.get('refresh_result'):
+            st.caption(st.session_state.refresh_result)
+        if st.button("Reload data"):
+            source.reload()
+            warmer.wake()
+            st.rerun()
+
+# Sidebar panel with the stage timings of this session's previous rerun and its
+# totals over all reruns (shown when CLAIMS_INSTRUMENT=1)
+def display_instrumentation_panel(instrumentation):
+    with st.sidebar.expander("Render timings"):
+        if instrumentation is None:
+            st.caption("Timings appear after the first rerun.")
+            return
+        st.write("Last rerun")
+        st.dataframe(pd.DataFrame(timing_rows(instrumentation.last.stages)), hide_index=True)
+        st.write(f"Session totals over {instrumentation.reruns} reruns")
+        st.dataframe(pd.DataFrame(timing_rows(instrumentation.totals)), hide_index=True)
+        st.caption(f"Session {instrumentation.session_id[:8]}")
+
+# Page sizes offered by the claims grid
+GRID_PAGE_SIZES = [20, 100, 500, 1000, 2500, 5000]
+
+# The Styler renders every cell to HTML before sending it, so larger pages are
+# sent as plain Arrow without row striping
+STRIPED_PAGE_ROWS = 500
+
+# Export download when no export server is configured (the default): generated
+# when the download is clicked, outside the rerun, but held in memory by Streamlit
+def instrumented_export(view, fmt, compress):
+    with stage('export'):
+        return export_bytes(view, fmt, compress)
+
+# Metric card formatting; KPIs without source data show as "n/a"
+def format_count(value):
+    return "n/a" if value is None else f"{value:,}"
+
+def format_percent(value):
+    return "n/a" if value is None else f"{value:.0f}"
+
+def format_money(value):
+    if value is None:
+        return "n/a"
+    for threshold, suffix in ((1e9, "B"), (1e6, "M"), (1e3, "K")):
+        if abs(value) >= threshold:
+            return f"${value / threshold:.1f}{suffix}"
+    return f"${value:,.0f}"
+
+# Claim numbers typed into the sidebar, comma-separated
+def parse_claim_numbers(text):
+    return [num.strip() for num in text.split(",") if num.strip()] if text else []
+
+# Filter state held by the sidebar widgets at the start of this rerun. The widgets
+# are keyed, so a value the user just changed is already in session state before
+# the widgets are drawn again, and option counts can reflect it.
+def pending_filter_state():
+    state = st.session_state
+    claim_numbers = parse_claim_numbers(state.get('claim_number_filter', state.claim_numbers))
+    text_filters = {col: state.get(f'filter_{col}', state.text_filters[col]) for col in TEXT_FILTER_COLUMNS}
+    date_ranges = {}
+    for col in FILTER_DATE_COLUMNS:
+        date_range = state.get(f'range_{col}', state.date_filters[col])
+        if date_range:
+            date_ranges[col] = (date_range[0], date_range[-1])
+    return FilterState(claim_numbers, text_filters, date_ranges)
+
+# Streamlit app for the report with independent filters and charts
+def main():
+    # Display logo
+    st.image("exl.png", width=150)
+    st.title("Claim Report Dashboard Testing")
+
+    # Fetch data from the database
+    source = fetch_claims_data()
+
+    if source is not None:
+        # Initialize session state for date filters
+        if "date_filters" not in st.session_state:
+            st.session_state.date_filters = {
+                col: source.date_bounds(col)
+                for col in FILTER_DATE_COLUMNS
+            }
+
+        # Sidebar for filters
+        st.sidebar.header("Filter Options")
+
+        # Initialize session state for filters
+        if 'claim_numbers' not in st.session_state:
+            params = st.query_params
+            st.session_state.claim_numbers = params.get('claim_numbers', '')
+
+        # Apply claim number filter
+        claim_numbers = st.sidebar.text_input(
+            "Filter by Claim Number (comma-separated)", 
+            value=st.session_state.claim_numbers,
+            help="End a claim number with * to match every claim starting with it",
+            key='claim_number_filter'
+        )
+        st.session_state.claim_numbers = claim_numbers
+        claim_numbers = parse_claim_numbers(claim_numbers)
+
+        # Text-based filters with an "All" option for each relevant column
+        text_columns = TEXT_FILTER_COLUMNS
+
+        # Initialize text filters in session state if not present
+        if 'text_filters' not in st.session_state:
+            params = st.query_params
+            # get_all, because get returns only the last value as a string
+            st.session_state.text_filters = {
+                col: params.get_all(col) or ['All']
+                for col in text_columns
+            }
+
+        # Claims each option would match under the other filters, for all six
+        # filters at once
+        pending_state = pending_filter_state()
+        with stage('facets'):
+            pending_view = source.view(pending_state, st.session_state)
+            facets = aggregate_cache.get_or_compute(
+                aggregate_key('facets', pending_view, pending_state), pending_view.facet_counts
+            )
+
+        # Collect text-based filters
+        text_filters = {}
+        for col in text_columns:
+            unique_values = list(source.filter_options(col))
+            unique_values.insert(0, "All")  # Add "All" option
+            option_counts = facets.get(col, {})
+            selected_values = st.sidebar.multiselect(
+                f"Filter by {col}", 
+                options=unique_values, 
+                default=st.session_state.text_filters[col],
+                format_func=lambda value, counts=option_counts: (
+                    value if value == "All" else f"{value} ({counts.get(value, 0):,})"
+                ),
+                key=f'filter_{col}'
+            )
+            st.session_state.text_filters[col] = selected_values
+            text_filters[col] = selected_values
+
+        # Independent Date range filters
+        date_ranges = {}
+        for col in FILTER_DATE_COLUMNS:
+            min_date, max_date = st.session_state.date_filters[col]
+            date_range = st.sidebar.date_input(f"{col} Range", value=(min_date, max_date), key=f'range_{col}')
+            st.session_state.date_filters[col] = date_range
+            if date_range:
+                date_ranges[col] = (date_range[0], date_range[-1])
+
+        # Apply the filters in the source ("All" disables a text filter); the in-memory
+        # source re-evaluates only the filters that changed since this session's last rerun
+        filter_state = FilterState(claim_numbers, text_filters, date_ranges)
+        with stage('filter'):
+            view = source.view(filter_state, st.session_state)
+            counts = aggregate_cache.get_or_compute(aggregate_key('counts', view, filter_state), view.counts)
+
+        # Count each filter state a session moves to toward the warm-up of popular views
+        if st.session_state.get('recorded_view') != filter_state.key():
+            st.session_state.recorded_view = filter_state.key()
+            record_view(source, filter_state)
+
+        display_dataset_panel(source)
+
+        # Display filtered statistics
+        st.markdown("""
+            <style>
+                h3 {
+                    color: #5d3a9b !important;
+                }
+            </style>
+        """, unsafe_allow_html=True)
+        st.subheader("Filtered Claims Statistics")
+        st.write("Total Claims:", counts['claims'])
+
+        def display_custom_metric(title, value, background_color="#f0f0f0"):
+            card_style = f"""
+            <style>
+            .metric-card {{
+                border: 2px solid #5d3a9b;
+                border-radius: 8px;
+                background-color: {background_color};
+                padding: 20px;
+                margin: 10px;
+                height: 200px;  
+                width: 160px;
+                box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
+            }}
+            .metric-card h3 {{
+                color: #5d3a9b;
+                font-size: 18px;
+                margin-bottom: 10px;
+            }}
+            .metric-card .value {{
+                font-size: 36px;
+                font-weight: bold;
+                color: #333;
+                margin-bottom: 0px;
+            }}
+            </style>
+            """
+
+            # HTML for the metric card
+            card_html = f"""
+            <div class="metric-card">
+                <h3>{title}</h3>
+                <div class="value">{value}</div>
+            </div>
+            """
+
+            # Render the card with custom styling
+            st.markdown(card_style + card_html, unsafe_allow_html=True)
+        
+        st.subheader("Metrics Overview")
+
+        # Leakage KPIs for the same selection the charts use, computed in one pass
+        with stage('kpis'):
+            kpis = aggregate_cache.get_or_compute(aggregate_key('kpis', view, filter_state), view.kpis)
+
+        col1, col2, col3, col4, col5, col6 = st.columns(6)
+        
+        with col1:
+            display_custom_metric("Claims Monitored", format_count(kpis['claims_monitored']))
+        with col2:
+            display_custom_metric("Claims with Leakage Opportunity", format_count(kpis['leakage_opportunities']))
+
+        with col3:
+            def display_gauge_in_metric_card(title, gauge_value, background_color="#f0f0f0"):
+                if not isinstance(gauge_value, (int, float)):
+                    raise ValueError("gauge_value must be a numeric type.")
+
+                card_style = f"""
+                <style>
+                .gauge-card {{
+                    border: 2px solid #5d3a9b;
+                    border-radius: 8px;
+                    background-color: {background_color};
+                    padding: 20px;
+                    margin: 10px;
+                    box-shadow: 0 4px 8px rgba(0, 0, 0, 0.1);
+                    height: 400px;  /* Fixed height for all cards */
+                    width: 300px;   /* Fixed width for all cards */
+                    display: flex;
+                    flex-direction: column;
+                    align-items: center;
+                    text-align: center;
+                    justify-content: space-between;
+                }}
+                .gauge-card h3 {{
+                    color: #5d3a9b;
+                    font-size: 18px;
+                    margin-bottom: 10px;
+                }}
+                </style>
+                """
+
+                fig = go.Figure(go.Indicator(
+                    mode="gauge+number",
+                    value=gauge_value,
+                    gauge={'axis': {'range': [0, 100]}, 'bar': {'color': "#5d3a9b"}},
+                    title={'text': f"{title} (%)", 'font': {'size': 16, 'color': 'black'}},
+                    domain={'x': [0, 1], 'y': [0, 1]}
+                ))
+                fig.update_layout(height=170, margin=dict(t=0, b=0, l=0, r=0))
+
+                with st.container():
+                    st.markdown(card_style, unsafe_allow_html=True)
+                    st.markdown(f"<div class='gauge-card'><h3>{title}</h3></div>", unsafe_allow_html=True)
+                    st.plotly_chart(fig, use_container_width=True)
+
+            display_custom_metric("Leakage Opportunity %", format_percent(kpis['leakage_opportunity_pct']))
+
+        with col4:
+            display_custom_metric("Potential Leakage $", format_money(kpis['potential_leakage']))
+
+        with col5:
+            display_custom_metric("Leakage Rate %", format_percent(kpis['leakage_rate_pct']))
+
+        with col6:
+            display_custom_metric("Opportunities Not Actioned", format_count(kpis['opportunities_not_actioned']))
+        
+        st.markdown("<br><br>", unsafe_allow_html=True)
+
+        # Chart aggregates are shared across sessions viewing the same filters
+        with stage('chart_aggregates'):
+            aggregates = aggregate_cache.get_or_compute(
+                aggregate_key('charts', view, filter_state), view.chart_aggregates
+            )
+
+        col1, col2 = st.columns(2, gap="small")
+
+        with col1:
+            st.subheader("Claims by Status")
+            with stage('figure/status'):
+                st.plotly_chart(cached_figure('status', aggregates))
+
+        with col2:
+            st.subheader("Claims Over Time")
+            with stage('figure/claims_over_time'):
+                st.plotly_chart(cached_figure('claims_over_time', aggregates))
+
+        col3, col4 = st.columns(2, gap="small")
+
+        with col3:
+            st.subheader("Claim Status Distribution")
+            with stage('figure/status_distribution'):
+                st.plotly_chart(cached_figure('status_distribution', aggregates))
+
+        with col4:
+            st.subheader("Claims by Line of Business")
+            with stage('figure/line_of_business'):
+                st.plotly_chart(cached_figure('line_of_business', aggregates))
+            
+        st.subheader("Claim Status Trend Over Months")
+        with stage('figure/monthly_trend'):
+            st.plotly_chart(cached_figure('monthly_trend', aggregates))
+        
+        st.subheader("Filtered Claims Data")
+
+        # Paginated grid over the whole selection, sorted by the source
+        sort_col, order_col, size_col, page_col = st.columns(4)
+        with sort_col:
+            sort_by = st.selectbox("Sort by", ["(none)"] + source.columns, key="grid_sort_by")
+        with order_col:
+            sort_order = st.radio("Order", ["Ascending", "Descending"], horizontal=True, key="grid_sort_order")
+        with size_col:
+            page_size = st.selectbox("Rows per page", GRID_PAGE_SIZES, key="grid_page_size")
+        page_count = max(1, -(-counts['rows'] // page_size))
+        if st.session_state.get("grid_page", 1) > page_count:
+            st.session_state.grid_page = page_count
+        with page_col:
+            page = st.number_input("Page", min_value=1, max_value=page_count, step=1, key="grid_page")
+
+        with stage('grid/page'):
+            grid_view = view.sorted(sort_by, sort_order == "Ascending") if sort_by != "(none)" else view
+            start = (page - 1) * page_size
+            filtered_data = grid_view.page(start, start + page_size)
+        rows_caption = f"Rows {min(start + 1, counts['rows']):,}–{start + len(filtered_data):,} of {counts['rows']:,}"
+        if len(filtered_data) > STRIPED_PAGE_ROWS:
+            rows_caption += f" (rows are not striped on pages over {STRIPED_PAGE_ROWS:,})"
+        st.caption(rows_caption)
+
+        # Striping is one CSS string per row broadcast across the columns,
+        # rather than a same-shape frame of per-cell strings
+        def style_alternate_rows(x):
+            row_styles = np.where(
+                np.arange(len(x)) % 2 == 0,
+                'background-color: #f9f9f9',  # Light gray for even rows
+                'background-color: #e6e6e6'  # Slightly darker gray for odd rows
+            )
+            return np.broadcast_to(row_styles[:, None], x.shape)
+
+        with stage('grid/render'):
+            if len(filtered_data) <= STRIPED_PAGE_ROWS:
+                grid_data = filtered_data.style.apply(style_alternate_rows, axis=None)
+            else:
+                grid_data = filtered_data
+            st.dataframe(grid_data, column_config={
+                col: st.column_config.DateColumn() for col in DATE_COLUMNS
+            })
+
+        # Export of the whole selection in grid order. With an export server
+        # configured, it is written in chunks to a temporary file when the link
+        # is opened and streamed from there.
+        format_col, compress_col, download_col = st.columns(3)
+        with format_col:
+            export_format = st.radio("Export format", list(EXPORT_FORMATS), horizontal=True, key="export_format")
+        with compress_col:
+            export_gzip = st.checkbox("Compress (gzip)", key="export_gzip")
+        with download_col:
+            file_name = export_file_name("filtered_claims", export_format, export_gzip)
+            export_key = (view.version, filter_state.key(), sort_by, sort_order, export_format, export_gzip)
+            url = export_url(export_key, grid_view, export_format, export_gzip, file_name)
+            if url is not None:
+                st.link_button(f"Download {counts['rows']:,} rows", url)
+            else:
+                st.download_button(
+                    f"Download {counts['rows']:,} rows",
+                    lambda: instrumented_export(grid_view, export_format, export_gzip),
+                    file_name,
+                    export_mime(export_format, export_gzip),
+                )
+        
+    else:
+        st.warning("No data available. Run `python generate_claims.py` to create a synthetic Claims.csv.")
+
+    if INSTRUMENT:
+        display_instrumentation_panel(st.session_state.get('instrumentation'))
+
+if __name__ == "__main__":
+    # Once per process: warm the popular views, and serve the JSON API (and, with
+    # CLAIMS_API_URL, the export links) when CLAIMS_API_PORT is set
+    start_claims_api()
+    with instrumented_rerun(st.session_state):
+        main()
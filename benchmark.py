@@ -0,0 +1,130 @@
+import argparse
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from claims_aggregates import KpiEngine, chart_aggregates, get_kpi_engine
+from claims_data import ClaimsDataset, apply_claims_schema
+from claims_filters import ClaimsSelection, FilterState, get_filter_engine
+from generate_claims import generate_claims
+
+
+# Synthetic claims typed as the dashboard loads them, from the same generator
+# the other benchmarks write their CSV extracts with
+def synthetic_claims(rows, seed=0):
+    return apply_claims_schema(generate_claims(rows, seed))
+
+
+# Best-of-N wall time of fn in milliseconds; with min_seconds, fast calls keep
+# being repeated until that much time has been spent timing them
+def time_ms(fn, repeats, min_seconds=0.0):
+    best = float('inf')
+    runs = spent = 0
+    while runs < repeats or spent < min_seconds:
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = min(best, elapsed)
+        runs += 1
+        spent += elapsed
+    return best * 1000
+
+
+def benchmark_kpis(frame, repeats):
+    engine = KpiEngine(frame)
+    rng = np.random.default_rng(1)
+    n_rows = len(frame)
+    # Every row is answered from precomputed totals, so the largest selection
+    # timed leaves one row out to measure a full gather-and-sum
+    selections = {
+        'all rows but one': np.arange(1, n_rows),
+        '50% of rows': np.sort(rng.choice(n_rows, n_rows // 2, replace=False)),
+        '5% of rows': np.sort(rng.choice(n_rows, n_rows // 20, replace=False)),
+    }
+    return {name: time_ms(lambda rows=rows: engine.compute(rows), repeats) for name, rows in selections.items()}
+
+
+# The data path of one main() rerun: filter, total claims, KPIs, chart aggregates
+# and the first table page, bypassing the shared aggregate cache
+def render_rerun(dataset, filter_state):
+    rows = get_filter_engine(dataset).select(filter_state)
+    selection = ClaimsSelection(dataset, rows)
+    selection.nunique('claim_number')
+    get_kpi_engine(dataset).compute(rows)
+    chart_aggregates(dataset, filter_state, selection)
+    selection.frame(stop=20)
+
+
+# Peak bytes allocated by one rerun once the per-dataset indexes exist. The state
+# narrows claim_loss_date, so the charts are aggregated from rows, not the cube.
+def benchmark_rerun_allocations(frame):
+    dataset = ClaimsDataset(frame, 'synthetic', None, 0, 0.0)
+    loss_dates = frame['claim_loss_date']
+    filter_state = FilterState(
+        text_filters={'claim_status': ['Open', 'Reopened']},
+        date_ranges={'claim_loss_date': (loss_dates.min(), loss_dates.min() + pd.Timedelta(days=730))},
+    )
+    render_rerun(dataset, filter_state)
+
+    tracemalloc.start()
+    render_rerun(dataset, filter_state)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the dashboard computations on synthetic claims')
+    parser.add_argument(
+        '--rows',
+        type=int,
+        default=1_000_000,
+        help='Number of synthetic claims (default: 1000000)'
+    )
+    parser.add_argument(
+        '--repeats',
+        type=int,
+        default=5,
+        help='Timed runs per measurement; the best is reported (default: 5)'
+    )
+    parser.add_argument(
+        '--kpi-budget-ms',
+        type=float,
+        default=50.0,
+        help='Latency budget for one KPI computation (default: 50)'
+    )
+    parser.add_argument(
+        '--rerun-alloc-mb',
+        type=float,
+        default=32.0,
+        help='Cap on the peak allocation of one rerun, in MB (default: 32)'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    print(f"Generating {args.rows:,} synthetic claims...")
+    frame = synthetic_claims(args.rows)
+
+    print("\nKPI engine:")
+    over_budget = False
+    for name, elapsed in benchmark_kpis(frame, args.repeats).items():
+        status = "ok" if elapsed <= args.kpi_budget_ms else "OVER BUDGET"
+        over_budget = over_budget or elapsed > args.kpi_budget_ms
+        print(f"{name}: {elapsed:.2f} ms ({status}, budget {args.kpi_budget_ms:.0f} ms)")
+
+    print("\nRerun allocations:")
+    peak_mb = benchmark_rerun_allocations(frame) / 1024 ** 2
+    status = "ok" if peak_mb <= args.rerun_alloc_mb else "OVER BUDGET"
+    over_budget = over_budget or peak_mb > args.rerun_alloc_mb
+    print(f"peak: {peak_mb:.1f} MB ({status}, cap {args.rerun_alloc_mb:.0f} MB)")
+
+    if over_budget:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+from claims_data import read_claims_csv, read_claims_csv_parallel
+from generate_claims import write_claims_csv
+
+
+# Same columns, dtypes and values (categories included)
+def identical(left, right):
+    return list(left.columns) == list(right.columns) and all(
+        left[col].dtype == right[col].dtype and left[col].equals(right[col]) for col in left.columns
+    )
+
+
+# Best-of-N load time in seconds, with the frame of the last run
+def time_load(load, repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        frame = load()
+        best = min(best, time.perf_counter() - start)
+    return best, frame
+
+
+def parse_arguments():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description='Benchmark the parallel CSV loader against the single-process one')
+    parser.add_argument(
+        '--rows',
+        default='1000000,5000000,10000000',
+        help='Comma-separated synthetic file sizes in rows (default: 1000000,5000000,10000000)'
+    )
+    parser.add_argument(
+        '--workers',
+        default=','.join(str(n) for n in sorted({1, 2, 4, 8, cores}) if n <= cores),
+        help='Comma-separated worker counts (default: powers of two up to the core count)'
+    )
+    parser.add_argument(
+        '--repeats',
+        type=int,
+        default=1,
+        help='Timed loads per measurement; the best is reported (default: 1)'
+    )
+    parser.add_argument(
+        '--dir',
+        default=None,
+        help='Directory for the synthetic files (default: a temporary directory)'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    worker_counts = [int(n) for n in args.workers.split(',')]
+    mismatch = False
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as directory:
+        for rows in (int(n) for n in args.rows.split(',')):
+            path = os.path.join(directory, f"claims_{rows}.csv")
+            print(f"\nWriting {rows:,} synthetic claims...")
+            write_claims_csv(path, rows)
+            size_mb = os.path.getsize(path) / 1024 ** 2
+
+            baseline, expected = time_load(lambda: read_claims_csv(path), args.repeats)
+            print(f"single process: {baseline:.2f}s ({size_mb / baseline:,.1f} MB/s)")
+            for workers in worker_counts:
+                elapsed, frame = time_load(lambda: read_claims_csv_parallel(path, workers), args.repeats)
+                same = identical(expected, frame)
+                mismatch = mismatch or not same
+                print(
+                    f"{workers} workers: {elapsed:.2f}s ({size_mb / elapsed:,.1f} MB/s),"
+                    f" speedup {baseline / elapsed:.2f}x, {'identical' if same else 'DIFFERENT'}"
+                )
+            del expected, frame
+            os.remove(path)
+
+    if mismatch:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
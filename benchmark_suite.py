@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from benchmark import time_ms
+from claims_aggregates import ClaimsCube, KpiEngine, chart_aggregates, get_kpi_engine
+from claims_charts import CHART_FIGURES, cached_figure
+from claims_data import (
+    FILTER_DATE_COLUMNS, TEXT_FILTER_COLUMNS, ClaimsDataset, read_claims_csv, read_claims_snapshot,
+    write_claims_snapshot,
+)
+from claims_filters import ClaimNumberIndex, ClaimsFilterEngine, ClaimsSelection, FilterState, get_filter_engine
+from generate_claims import write_claims_csv
+
+BASELINE_PATH = "benchmark_baseline.json"
+
+
+# The state of a fresh session: every text filter on "All" and every date range
+# spanning its column
+def default_filter_state(frame):
+    return FilterState(date_ranges={col: (frame[col].min(), frame[col].max()) for col in FILTER_DATE_COLUMNS})
+
+
+# The default state with some filters replaced
+def narrowed_state(frame, claim_numbers=(), text_filters=None, date_ranges=None):
+    default = default_filter_state(frame)
+    return FilterState(claim_numbers, text_filters, {**default.date_ranges, **(date_ranges or {})})
+
+
+# Name -> callable for every timed step of serving the dashboard from the CSV at
+# path, whose typed frame is given; scratch files go in directory
+def dashboard_benchmarks(path, frame, directory):
+    snapshot_path = os.path.join(directory, "claims.arrow")
+    dataset = ClaimsDataset(frame, path, None, 0, 0.0)
+    engine = get_filter_engine(dataset)
+    write_claims_snapshot(path, snapshot_path)
+
+    benchmarks = {
+        'load/read_csv': lambda: read_claims_csv(path),
+        'load/write_snapshot': lambda: write_claims_snapshot(path, snapshot_path),
+        'load/read_snapshot': lambda: read_claims_snapshot(snapshot_path),
+        'load/claim_index': lambda: ClaimNumberIndex(frame['claim_number']),
+        'load/filter_engine': lambda: ClaimsFilterEngine(frame),
+        'load/kpi_engine': lambda: KpiEngine(frame),
+        'load/cube': lambda: ClaimsCube(frame),
+    }
+
+    # Each filter on top of the default state, as the sidebar applies it
+    default = default_filter_state(frame)
+    claim_numbers = list(frame['claim_number'].dropna().sample(100, random_state=0))
+    states = {
+        'filter/default': default,
+        'filter/claim_number': narrowed_state(frame, claim_numbers),
+        'filter/claim_number_prefix': narrowed_state(frame, [claim_numbers[0][:-3] + "*"]),
+    }
+    for col in TEXT_FILTER_COLUMNS:
+        states[f'filter/{col}'] = narrowed_state(frame, text_filters={col: [frame[col].mode()[0]]})
+    for col in FILTER_DATE_COLUMNS:
+        start = frame[col].min()
+        states[f'filter/{col}'] = narrowed_state(frame, date_ranges={col: (start, start + pd.Timedelta(days=365))})
+    for name, state in states.items():
+        benchmarks[name] = lambda state=state: engine.select(state)
+
+    # The cube answers the default state; a narrowed loss date needs the selected rows
+    narrowed = states['filter/claim_loss_date']
+    default_selection = ClaimsSelection(dataset, engine.select(default))
+    narrowed_selection = ClaimsSelection(dataset, engine.select(narrowed))
+    benchmarks['aggregate/kpis'] = lambda: get_kpi_engine(dataset).compute(default_selection.rows)
+    benchmarks['aggregate/total_claims'] = lambda: default_selection.nunique('claim_number')
+    benchmarks['aggregate/charts_cube'] = lambda: chart_aggregates(dataset, default, default_selection)
+    benchmarks['aggregate/charts_rows'] = lambda: chart_aggregates(dataset, narrowed, narrowed_selection)
+    benchmarks['aggregate/table_page'] = lambda: default_selection.frame(stop=20)
+    benchmarks['aggregate/facets'] = lambda: engine.facet_counts(default)
+    benchmarks['aggregate/facets_filtered'] = lambda: engine.facet_counts(states['filter/claim_status'])
+
+    aggregates = chart_aggregates(dataset, default, default_selection)
+    for chart, build in CHART_FIGURES.items():
+        benchmarks[f'figure/{chart}'] = lambda build=build: build(aggregates)
+    for chart in CHART_FIGURES:
+        cached_figure(chart, aggregates)
+        benchmarks[f'figure/{chart}/cached'] = lambda chart=chart: cached_figure(chart, aggregates)
+    return benchmarks
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, rows, results):
+    with open(path, 'w') as f:
+        json.dump({'rows': rows, 'results_ms': results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+# Names of the benchmarks slower than the baseline by more than tolerance (a
+# fraction of that benchmark's own baseline) and noise_ms, printing every
+# comparison
+def compare_to_baseline(results, baseline, tolerance, noise_ms):
+    regressions = []
+    print(f"\n{'benchmark':<52}{'baseline':>12}{'current':>12}{'ratio':>8}")
+    for name, elapsed in results.items():
+        before = baseline['results_ms'].get(name)
+        if before is None:
+            print(f"{name:<52}{'-':>12}{elapsed:>10.2f}ms{'new':>8}")
+            continue
+        ratio = elapsed / before if before else float('inf')
+        regressed = elapsed - before > max(noise_ms, tolerance * before)
+        if regressed:
+            regressions.append(name)
+        status = "  REGRESSED" if regressed else ""
+        print(f"{name:<52}{before:>10.2f}ms{elapsed:>10.2f}ms{ratio:>7.2f}x{status}")
+    return regressions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Time load, filters, chart aggregation and figures headlessly and compare to a baseline'
+    )
+    parser.add_argument(
+        '--rows',
+        type=int,
+        default=200_000,
+        help='Number of synthetic claims to generate (default: 200000)'
+    )
+    parser.add_argument(
+        '--csv',
+        default=None,
+        help='Benchmark this extract instead of a generated one'
+    )
+    parser.add_argument(
+        '--repeats',
+        type=int,
+        default=3,
+        help='Timed runs per benchmark; the best is reported (default: 3)'
+    )
+    parser.add_argument(
+        '--min-seconds',
+        type=float,
+        default=0.5,
+        help='Keep repeating a benchmark until it has been timed this long, so '
+             'millisecond steps get many runs (default: 0.5)'
+    )
+    parser.add_argument(
+        '--filter',
+        default='',
+        help='Only run benchmarks whose name contains this text'
+    )
+    parser.add_argument(
+        '--baseline',
+        default=BASELINE_PATH,
+        help=f'Baseline results file (default: {BASELINE_PATH})'
+    )
+    parser.add_argument(
+        '--save-baseline',
+        action='store_true',
+        help='Store these results as the new baseline instead of comparing'
+    )
+    parser.add_argument(
+        '--tolerance',
+        type=float,
+        default=0.25,
+        help="Allowed slowdown as a fraction of each benchmark's baseline (default: 0.25)"
+    )
+    parser.add_argument(
+        '--noise-ms',
+        type=float,
+        default=1.0,
+        help='Slowdowns smaller than this many ms are never reported (default: 1.0)'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.csv
+        if path is None:
+            path = os.path.join(directory, "claims.csv")
+            print(f"Generating {args.rows:,} synthetic claims...")
+            write_claims_csv(path, args.rows)
+
+        frame = read_claims_csv(path)
+        rows = len(frame)
+        benchmarks = dashboard_benchmarks(path, frame, directory)
+        results = {}
+        for name, run in benchmarks.items():
+            if args.filter in name:
+                results[name] = round(time_ms(run, args.repeats, args.min_seconds), 3)
+                print(f"{name}: {results[name]:.2f} ms")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, rows, results)
+        print(f"\nSaved baseline for {rows:,} rows to {args.baseline}")
+        return
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    if baseline['rows'] != rows:
+        sys.exit(f"\nThe baseline was measured on {baseline['rows']:,} rows, not {rows:,}; pass --rows {baseline['rows']}")
+    regressions = compare_to_baseline(results, baseline, args.tolerance, args.noise_ms)
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed: {', '.join(regressions)}")
+        sys.exit(1)
+    print("\nNo regressions")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from claims_cache import LruCache
+from claims_data import FILTER_DATE_COLUMNS, delta_positions, register_delta_update, register_load_hook
+
+# Bounds of the process-wide aggregate cache
+AGGREGATE_CACHE_ENTRIES = 256
+AGGREGATE_CACHE_TTL_SECONDS = 15 * 60
+
+# Most points a time-series chart sends to the browser; set CLAIMS_CHART_POINT_BUDGET to change
+CHART_POINT_BUDGET = int(os.environ.get('CLAIMS_CHART_POINT_BUDGET', '500'))
+
+# Pre-aggregate every loaded dataset into a count cube; set CLAIMS_PREAGGREGATE=0 to disable
+PREAGGREGATE = os.environ.get('CLAIMS_PREAGGREGATE', '1') != '0'
+
+# Share of correction cells at which an upserted cube is compacted
+CUBE_COMPACT_RATIO = 0.1
+
+# Dimensions of the count cube, besides the received day
+CUBE_DIMENSIONS = [
+    'claim_status', 'line_of_business', 'source_system', 'general_nature_of_loss',
+    'fault_rating', 'fault_categorisation'
+]
+
+
+# Aggregates of filtered views shared between sessions, kept for
+# AGGREGATE_CACHE_TTL_SECONDS
+aggregate_cache = LruCache(max_entries=AGGREGATE_CACHE_ENTRIES, ttl_seconds=AGGREGATE_CACHE_TTL_SECONDS)
+
+
+# Key for anything computed from the filtered rows of one data version; source is
+# a dataset or a claims source view, both of which carry a version
+def aggregate_key(name, source, filter_state):
+    return (name, source.version, filter_state.key())
+
+
+def _counts(values, column):
+    counts = values.value_counts()
+    counts = counts[counts > 0].reset_index()
+    counts.columns = [column, 'count']
+    return counts
+
+
+def _month_year(received):
+    return received.dt.to_period('M').astype(str).where(received.notna())
+
+
+# Month bucket of every claim, derived once per dataset version
+def get_month_year(dataset):
+    return dataset.derived(
+        'month_year', lambda d: _month_year(d.frame['claim_received_date']).astype('category')
+    )
+
+
+# Month buckets after an upsert: the old codes remapped onto the (sorted) union of
+# months, and the overwritten and appended rows bucketed afresh
+def _updated_month_year(month_year, dataset, delta):
+    touched = delta_positions(delta, len(dataset.frame))
+    months = _month_year(dataset.frame['claim_received_date'].take(touched))
+    categories = month_year.cat.categories.union(pd.Index(months.dropna().unique()))
+    remap = np.append(categories.get_indexer(month_year.cat.categories), -1)
+    codes = np.full(len(dataset.frame), -1, dtype=np.int64)
+    codes[:len(month_year)] = remap[month_year.cat.codes.to_numpy()]
+    codes[touched] = categories.get_indexer(months)
+    return pd.Series(pd.Categorical.from_codes(codes, categories), name=month_year.name)
+
+
+# Aggregates behind the dashboard charts, computed from the filtered claims;
+# month_year may be passed in when it is already known for those rows
+def compute_chart_aggregates(filtered_data, month_year=None):
+    if month_year is None:
+        month_year = _month_year(filtered_data['claim_received_date'])
+    monthly_status_counts = (
+        filtered_data.groupby([month_year.rename('month_year'), 'claim_status'], observed=True)
+        .size()
+        .reset_index(name='count')
+    )
+    return {
+        'status_counts': _counts(filtered_data['claim_status'], 'claim_status'),
+        'line_of_business_counts': _counts(filtered_data['line_of_business'], 'line_of_business'),
+        'claims_over_time': filtered_data.groupby('claim_received_date').size().reset_index(name='claim_count'),
+        'monthly_status_counts': monthly_status_counts,
+        'monthly_totals': monthly_status_counts.groupby('month_year')['count'].sum().reset_index(),
+    }
+
+
+# Claim counts per combination of the cube dimensions and received day. Only
+# rows with every filter date present are counted: those are exactly the rows
+# that date ranges spanning their whole column keep, which is the sidebar default.
+# Upserts append signed corrections to the cells instead of merging them, so a
+# combination may appear more than once; rollups sum the counts anyway.
+class ClaimsCube:
+    def __init__(self, frame):
+        self.dimensions = [col for col in CUBE_DIMENSIONS if col in frame.columns]
+        self.date_bounds = {col: (frame[col].min(), frame[col].max()) for col in FILTER_DATE_COLUMNS}
+        self.cells = self._with_month_year(self._count(frame))
+        self.corrections = 0
+
+    def _count(self, rows):
+        complete = rows[FILTER_DATE_COLUMNS].notna().all(axis=1)
+        return (
+            rows.loc[complete, self.dimensions + ['claim_received_date']]
+            .groupby(self.dimensions + ['claim_received_date'], observed=True, dropna=False)
+            .size()
+            .reset_index(name='count')
+        )
+
+    def _with_month_year(self, cells):
+        cells['month_year'] = _month_year(cells['claim_received_date']).astype('category')
+        return cells
+
+    # Cube for the upserted frame: the previous values of overwritten rows are
+    # counted out and the overwritten and appended rows counted in, as correction
+    # cells. Corrections are folded into the cells once they reach
+    # CUBE_COMPACT_RATIO of the cube.
+    def updated(self, frame, delta):
+        removed = self._count(delta.old_rows)
+        removed['count'] = -removed['count']
+        added = self._count(frame.take(delta_positions(delta, len(frame))))
+        keys = self.dimensions + ['claim_received_date']
+        change = (
+            pd.concat(self._aligned([removed, added], frame), ignore_index=True)
+            .groupby(keys, observed=True, dropna=False)['count'].sum()
+            .reset_index()
+        )
+        change = self._with_month_year(change[change['count'] != 0].reset_index(drop=True))
+
+        cube = ClaimsCube.__new__(ClaimsCube)
+        cube.dimensions = self.dimensions
+        cube.date_bounds = {col: (frame[col].min(), frame[col].max()) for col in FILTER_DATE_COLUMNS}
+        cube.cells = pd.concat(self._aligned([self.cells, change], frame), ignore_index=True)
+        cube.corrections = self.corrections + len(change)
+        if cube.corrections > CUBE_COMPACT_RATIO * len(cube.cells):
+            cells = (
+                cube.cells.groupby(keys + ['month_year'], observed=True, dropna=False)['count'].sum()
+                .reset_index()
+            )
+            cube.cells = cells[cells['count'] != 0].reset_index(drop=True)
+            cube.corrections = 0
+        return cube
+
+    # Cell frames with the same categorical dtypes, so concat keeps categoricals
+    def _aligned(self, parts, frame):
+        dtypes = {col: frame[col].dtype for col in self.dimensions}
+        if all('month_year' in part.columns for part in parts):
+            months = parts[0]['month_year'].cat.categories
+            for part in parts[1:]:
+                months = months.union(part['month_year'].cat.categories)
+            dtypes['month_year'] = pd.CategoricalDtype(months)
+        return [part.astype(dtypes) for part in parts]
+
+    # The cube can answer a state with no claim-number filter, a received date range,
+    # and ranges spanning the whole column for every other date filter
+    def answers(self, state):
+        if state.claim_numbers or 'claim_received_date' not in state.date_ranges:
+            return False
+        if any(col not in self.dimensions for col in state.text_filters):
+            return False
+        for col in FILTER_DATE_COLUMNS:
+            if col == 'claim_received_date':
+                continue
+            if col not in state.date_ranges:
+                return False
+            (start, end), (low, high) = state.date_ranges[col], self.date_bounds[col]
+            if not (start <= low and end >= high):
+                return False
+        return True
+
+    # Chart aggregates rolled up from the cells matching the state
+    def rollup(self, state):
+        cells = self.cells
+        mask = cells['claim_received_date'].between(*state.date_ranges['claim_received_date'])
+        for col, values in state.text_filters.items():
+            mask &= cells[col].isin(values)
+        cells = cells[mask]
+
+        monthly_status_counts = (
+            cells.groupby(['month_year', 'claim_status'], observed=True)['count'].sum()
+            .reset_index()
+        )
+        monthly_status_counts = monthly_status_counts[monthly_status_counts['count'] > 0]
+        return {
+            'status_counts': _summed_counts(cells, 'claim_status'),
+            'line_of_business_counts': _summed_counts(cells, 'line_of_business'),
+            'claims_over_time': _positive(
+                cells.groupby('claim_received_date')['count'].sum()
+                .reset_index(name='claim_count'), 'claim_count'
+            ),
+            'monthly_status_counts': monthly_status_counts.reset_index(drop=True),
+            'monthly_totals': monthly_status_counts.groupby('month_year', observed=True)['count'].sum().reset_index(),
+        }
+
+
+def _positive(counts, column):
+    return counts[counts[column] > 0].reset_index(drop=True)
+
+
+def _summed_counts(cells, column):
+    counts = cells.groupby(column, observed=True)['count'].sum().sort_values(ascending=False)
+    return counts[counts > 0].reset_index()
+
+
+def get_claims_cube(dataset):
+    return dataset.derived('cube', lambda d: ClaimsCube(d.frame))
+
+
+# Columns the row-level chart aggregation reads
+CHART_COLUMNS = ['claim_status', 'line_of_business', 'claim_received_date']
+
+
+# Chart aggregates for a filter state: rolled up from the cube when it can answer
+# the state, otherwise computed from just the chart columns of the selected rows
+def chart_aggregates(dataset, filter_state, selection, point_budget=None):
+    if PREAGGREGATE and get_claims_cube(dataset).answers(filter_state):
+        aggregates = get_claims_cube(dataset).rollup(filter_state)
+    else:
+        aggregates = compute_chart_aggregates(
+            selection.frame(CHART_COLUMNS), get_month_year(dataset).take(selection.rows)
+        )
+    return downsample_chart_aggregates(aggregates, point_budget or CHART_POINT_BUDGET)
+
+
+# Coarsest-needed bucket for a daily series: the first of day, week or month
+# that fits the date span into the point budget
+def choose_time_bucket(start, end, point_budget):
+    days = (end - start).days + 1
+    if days <= point_budget:
+        return 'day'
+    if days / 7 <= point_budget:
+        return 'week'
+    return 'month'
+
+
+# Largest-Triangle-Three-Buckets: keep n_out points that preserve the visual shape
+# of the series, always including the first and last point
+def lttb(x, y, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = [0]
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        prev = keep[-1]
+        areas = np.abs(
+            (x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev])
+        )
+        keep.append(lo + int(np.argmax(areas)))
+    keep.append(n - 1)
+    return np.array(keep)
+
+
+def _downsample_over_time(claims_over_time, point_budget):
+    if len(claims_over_time) <= point_budget:
+        return claims_over_time, 'day'
+    dates = claims_over_time['claim_received_date']
+    bucket = choose_time_bucket(dates.min(), dates.max(), point_budget)
+    if bucket != 'day':
+        period_start = dates.dt.to_period('W' if bucket == 'week' else 'M').dt.start_time
+        claims_over_time = (
+            claims_over_time.groupby(period_start.rename('claim_received_date'))['claim_count'].sum()
+            .reset_index()
+        )
+    if len(claims_over_time) > point_budget:
+        keep = lttb(claims_over_time['claim_received_date'].astype('int64'), claims_over_time['claim_count'], point_budget)
+        claims_over_time = claims_over_time.iloc[keep].reset_index(drop=True)
+        bucket = f"{bucket}, downsampled"
+    return claims_over_time, bucket
+
+
+# The monthly trend sends a bar per month and status plus a total per month;
+# fold months into quarters or years until that fits the point budget
+def _rebucket_monthly(monthly_status_counts, point_budget):
+    months = monthly_status_counts['month_year'].astype(str)
+    n_months = months.nunique()
+    points_per_month = monthly_status_counts['claim_status'].nunique() + 1
+    if n_months * points_per_month <= point_budget:
+        return monthly_status_counts, 'month'
+
+    periods = pd.PeriodIndex(months, freq='M')
+    bucket, labels = 'quarter', periods.asfreq('Q').astype(str)
+    if periods.asfreq('Q').nunique() * points_per_month > point_budget:
+        bucket, labels = 'year', periods.asfreq('Y').astype(str)
+    rebucketed = (
+        monthly_status_counts.groupby([pd.Series(labels, index=months.index, name='month_year'), 'claim_status'], observed=True)
+        ['count'].sum()
+        .reset_index()
+    )
+    return rebucketed, bucket
+
+
+# Adapt the time series to the point budget before any figure is built
+def downsample_chart_aggregates(aggregates, point_budget):
+    aggregates = dict(aggregates)
+    aggregates['claims_over_time'], aggregates['time_bucket'] = _downsample_over_time(
+        aggregates['claims_over_time'], point_budget
+    )
+    monthly_status_counts, trend_bucket = _rebucket_monthly(aggregates['monthly_status_counts'], point_budget)
+    if trend_bucket != 'month':
+        aggregates['monthly_status_counts'] = monthly_status_counts
+        aggregates['monthly_totals'] = monthly_status_counts.groupby('month_year')['count'].sum().reset_index()
+    aggregates['trend_bucket'] = trend_bucket
+    return aggregates
+
+
+def _flags(frame, col):
+    if col not in frame.columns:
+        return np.zeros(len(frame), dtype=bool)
+    return frame[col].to_numpy(dtype=bool, na_value=False)
+
+
+def _amounts(frame, col):
+    if col not in frame.columns:
+        return np.zeros(len(frame))
+    return frame[col].to_numpy(dtype='float64', na_value=0.0)
+
+
+# One row per claim: 1, opportunity, opportunity not actioned, potential, incurred
+def _kpi_matrix(frame):
+    opportunity = _flags(frame, 'leakage_opportunity')
+    actioned = _flags(frame, 'opportunity_actioned')
+    return np.column_stack([
+        np.ones(len(frame)),
+        opportunity,
+        opportunity & ~actioned,
+        _amounts(frame, 'potential_leakage_amount'),
+        _amounts(frame, 'incurred_amount'),
+    ])
+
+
+# Leakage KPIs for any row selection of one dataset version. The per-row inputs
+# are packed into one row-major matrix, so all six KPIs come from a single
+# gather-and-sum over the selected rows. KPIs whose source columns are missing
+# from the extract are reported as None.
+class KpiEngine:
+    def __init__(self, frame):
+        self.n_rows = len(frame)
+        self.columns = set(frame.columns)
+        self._matrix = _kpi_matrix(frame)
+        self._totals = self._matrix.sum(axis=0)
+
+    # Engine for the upserted frame: only the overwritten and appended rows are
+    # recomputed, and the totals adjusted by their difference
+    def updated(self, frame, delta):
+        touched = delta_positions(delta, len(frame))
+        engine = KpiEngine.__new__(KpiEngine)
+        engine.n_rows = len(frame)
+        engine.columns = set(frame.columns)
+        engine._matrix = np.empty((engine.n_rows, self._matrix.shape[1]))
+        engine._matrix[:self.n_rows] = self._matrix
+        engine._matrix[touched] = _kpi_matrix(frame.take(touched))
+        engine._totals = (
+            self._totals - self._matrix[delta.changed].sum(axis=0) + engine._matrix[touched].sum(axis=0)
+        )
+        return engine
+
+    def compute(self, rows=None):
+        if rows is None or len(rows) == self.n_rows:
+            totals = self._totals
+        else:
+            totals = self._matrix[rows].sum(axis=0)
+        return kpi_values(totals.tolist(), self.columns)
+
+
+# The six KPIs from the column totals (claims, opportunities, opportunities not
+# actioned, potential leakage, incurred), given which source columns exist
+def kpi_values(totals, columns):
+    claims, opportunities, not_actioned, potential, incurred = totals
+    has_opportunity = 'leakage_opportunity' in columns
+    has_potential = 'potential_leakage_amount' in columns
+    return {
+        'claims_monitored': int(claims),
+        'leakage_opportunities': int(opportunities) if has_opportunity else None,
+        'leakage_opportunity_pct': (
+            100 * opportunities / claims if has_opportunity and claims else None
+        ),
+        'potential_leakage': potential if has_potential else None,
+        'leakage_rate_pct': (
+            100 * potential / incurred if has_potential and incurred else None
+        ),
+        'opportunities_not_actioned': (
+            int(not_actioned) if has_opportunity and 'opportunity_actioned' in columns else None
+        ),
+    }
+
+
+def get_kpi_engine(dataset):
+    return dataset.derived('kpi_engine', lambda d: KpiEngine(d.frame))
+
+
+register_load_hook(get_month_year)
+register_delta_update('month_year', _updated_month_year)
+register_delta_update('kpi_engine', lambda engine, dataset, delta: engine.updated(dataset.frame, delta))
+register_delta_update('cube', lambda cube, dataset, delta: cube.updated(dataset.frame, delta))
+if PREAGGREGATE:
+    register_load_hook(get_claims_cube)
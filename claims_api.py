@@ -0,0 +1,454 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from claims_aggregates import AGGREGATE_CACHE_TTL_SECONDS, aggregate_cache, aggregate_key
+from claims_charts import CHART_FIGURES, figure_cache, figure_spec
+from claims_data import FILTER_DATE_COLUMNS, TEXT_FILTER_COLUMNS, register_load_hook
+from claims_export import export_links, export_mime, write_export_file
+from claims_filters import FilterState, sort_cache
+from claims_instrumentation import stage
+from claims_sources import get_claims_source
+
+# The JSON API is served at this address when CLAIMS_API_PORT is set; it has no
+# authentication, so it is off by default. The dashboard links its exports to
+# the server only when CLAIMS_API_URL says where browsers reach it, e.g. a
+# reverse proxy in front of it; otherwise they stay Streamlit downloads.
+API_HOST = os.environ.get('CLAIMS_API_HOST', '127.0.0.1')
+API_PORT = int(os.environ.get('CLAIMS_API_PORT', '0'))
+API_URL = os.environ.get('CLAIMS_API_URL', '')
+
+# Bytes copied to the socket at a time when streaming an export
+EXPORT_COPY_BYTES = 1024 ** 2
+
+# Most requested filter states precomputed at startup and after every data
+# reload (0 disables the warm-up); request counts persist in this file
+WARM_VIEWS = int(os.environ.get('CLAIMS_WARM_VIEWS', '10'))
+POPULAR_VIEWS_PATH = os.environ.get('CLAIMS_POPULAR_VIEWS', 'popular_views.json')
+
+# Distinct filter states counted; the least requested are dropped beyond this
+POPULAR_VIEWS_MAX = 1000
+
+# Seconds between writes of the request counts
+POPULAR_SAVE_SECONDS = 10
+
+# Seconds between checks for a new data version; warmed views are also refreshed
+# before the aggregate cache would expire them
+WARM_CHECK_SECONDS = 30
+
+# Largest page the rows endpoint returns
+API_PAGE_ROWS_MAX = 1000
+
+# Results the dashboard caches per filter state: aggregate cache name -> view method
+VIEW_RESULTS = {'counts': 'counts', 'kpis': 'kpis', 'charts': 'chart_aggregates', 'facets': 'facet_counts'}
+
+
+# Cached result of a view, under the same key the dashboard uses
+def view_result(view, name):
+    return aggregate_cache.get_or_compute(aggregate_key(name, view, view.filter_state), getattr(view, VIEW_RESULTS[name]))
+
+
+# Filter state with the date ranges that were left out spanning their column, as
+# in a fresh dashboard session
+def dashboard_filter_state(source, claim_numbers=(), text_filters=None, date_ranges=None):
+    date_ranges = dict(date_ranges or {})
+    for col in FILTER_DATE_COLUMNS:
+        if col not in date_ranges:
+            date_ranges[col] = source.date_bounds(col)
+    return FilterState(claim_numbers, text_filters, date_ranges)
+
+
+# Canonical form of a state with date ranges spanning their column left out, so a
+# stored view still means "all dates" once a reload has moved the bounds
+def portable_filters(source, state):
+    canonical = state.canonical()
+    for col in FILTER_DATE_COLUMNS:
+        bounds = [pd.Timestamp(value).isoformat() for value in source.date_bounds(col)]
+        if canonical['date_ranges'].get(col) == bounds:
+            del canonical['date_ranges'][col]
+    return canonical
+
+
+def state_from_portable(source, filters):
+    return dashboard_filter_state(
+        source, filters['claim_numbers'], filters['text_filters'], filters['date_ranges']
+    )
+
+
+# Filter state from query parameters in the form the dashboard puts in its URL:
+# claim_numbers=CLM1,CLM2*, one parameter per selected value of a text filter
+# (claim_status=Open&claim_status=Closed) and <date column>=YYYY-MM-DD..YYYY-MM-DD
+def filter_state_from_query(source, query):
+    claim_numbers = [
+        number.strip() for text in query.get('claim_numbers', []) for number in text.split(",") if number.strip()
+    ]
+    text_filters = {col: query[col] for col in TEXT_FILTER_COLUMNS if col in query}
+    date_ranges = {}
+    for col in FILTER_DATE_COLUMNS:
+        if col in query:
+            start, sep, end = query[col][-1].partition("..")
+            if not sep:
+                raise ValueError(f"{col} must be a range such as 2022-01-01..2022-06-30")
+            date_ranges[col] = (pd.Timestamp(start), pd.Timestamp(end))
+    return dashboard_filter_state(source, claim_numbers, text_filters, date_ranges)
+
+
+# Request counts per filter state, shared by the dashboard and the API and kept
+# in a JSON file so a new process knows which views to warm
+class PopularViews:
+    def __init__(self, path=POPULAR_VIEWS_PATH, max_views=POPULAR_VIEWS_MAX):
+        self.path = path
+        self.max_views = max_views
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        if path and os.path.exists(path):
+            try:
+                with open(path) as f:
+                    for entry in json.load(f):
+                        self._counts[json.dumps(entry['filters'], sort_keys=True)] = entry['requests']
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"Ignoring unreadable popular views file {path}: {e}")
+
+    def record(self, filters):
+        with self._lock:
+            self._counts[json.dumps(filters, sort_keys=True)] += 1
+            if len(self._counts) > self.max_views:
+                self._counts = Counter(dict(self._counts.most_common(self.max_views // 2)))
+            self._dirty = True
+            due = time.monotonic() - self._saved_at >= POPULAR_SAVE_SECONDS
+        if due:
+            self.save()
+
+    # [(filters, requests)] for the n most requested states
+    def top(self, n):
+        with self._lock:
+            return [(json.loads(key), count) for key, count in self._counts.most_common(n)]
+
+    def save(self):
+        with self._lock:
+            if not self.path or not self._dirty:
+                return
+            entries = [{'filters': json.loads(key), 'requests': count} for key, count in self._counts.most_common()]
+            self._dirty = False
+            self._saved_at = time.monotonic()
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Error saving popular views to {self.path}: {e}")
+
+
+popular_views = PopularViews()
+
+
+# Count a view of the dashboard or the API toward the warm-up
+def record_view(source, state):
+    popular_views.record(portable_filters(source, state))
+
+
+# Compute everything the dashboard shows above the grid for one filter state:
+# the cached counts, KPIs, facets, chart aggregates and chart figures
+def warm_view(source, state):
+    view = source.view(state)
+    for name in VIEW_RESULTS:
+        view_result(view, name)
+    aggregates = view_result(view, 'charts')
+    for chart in CHART_FIGURES:
+        figure_spec(chart, aggregates)
+
+
+# Background thread precomputing the default view and the most requested ones
+# whenever the data version changes, and again before the cached results expire
+class ViewWarmer:
+    def __init__(self, views=WARM_VIEWS, check_seconds=WARM_CHECK_SECONDS):
+        self.views = views
+        self.check_seconds = check_seconds
+        self.warmed_version = None
+        self.warmed_at = None
+        self.warmed_views = 0
+        self.warm_seconds = 0.0
+        self._wake = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._run, name='claims-warm-up', daemon=True).start()
+
+    # Check for a new version now rather than at the next interval
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            try:
+                self.warm()
+            except Exception as e:
+                print(f"Error warming popular views: {e}")
+            popular_views.save()
+            self._wake.wait(self.check_seconds)
+            self._wake.clear()
+
+    def warm(self):
+        source = get_claims_source()
+        version = source.metrics()['version']
+        expiring = self.warmed_at is not None and time.monotonic() - self.warmed_at > AGGREGATE_CACHE_TTL_SECONDS / 2
+        if version == self.warmed_version and not expiring:
+            return
+
+        start = time.perf_counter()
+        default = portable_filters(source, dashboard_filter_state(source))
+        filters = [default] + [f for f, _ in popular_views.top(self.views) if f != default][:self.views - 1]
+        for portable in filters:
+            warm_view(source, state_from_portable(source, portable))
+        self.warmed_version = version
+        self.warmed_at = time.monotonic()
+        self.warmed_views = len(filters)
+        self.warm_seconds = time.perf_counter() - start
+
+    def stats(self):
+        return {
+            'version': self.warmed_version,
+            'views': self.warmed_views,
+            'seconds': round(self.warm_seconds, 3),
+        }
+
+
+warmer = ViewWarmer()
+
+
+def _json_value(value):
+    if isinstance(value, dict):
+        return {str(key): _json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_json_value(item) for item in value]
+    if isinstance(value, pd.DataFrame):
+        return json.loads(value.to_json(orient='records', date_format='iso', date_unit='s'))
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+# The view a request's filters select. Only requests that get this far count
+# toward the popular views, so callers validate their other parameters first.
+def _view(source, query):
+    state = filter_state_from_query(source, query)
+    view = source.view(state)
+    record_view(source, state)
+    return view, {'version': view.version, 'filters': portable_filters(source, state)}
+
+
+def _int_param(query, name, default):
+    try:
+        return int(query[name][-1]) if name in query else default
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
+
+# Endpoints: path -> handler(source, query) returning the JSON body
+def api_status(source, query):
+    return {
+        'source': source.metrics(),
+        'aggregate_cache': aggregate_cache.stats(),
+        'figure_cache': figure_cache.stats(),
+        'sort_cache': sort_cache.stats(),
+        'warm_up': warmer.stats(),
+    }
+
+
+def api_kpis(source, query):
+    view, body = _view(source, query)
+    return {**body, 'counts': view_result(view, 'counts'), 'kpis': view_result(view, 'kpis')}
+
+
+def api_charts(source, query):
+    view, body = _view(source, query)
+    return {**body, 'charts': view_result(view, 'charts')}
+
+
+def api_facets(source, query):
+    view, body = _view(source, query)
+    return {**body, 'facets': view_result(view, 'facets')}
+
+
+# Rows [start, stop) of the selection, optionally sorted by a column
+# (sort=<column>, descending=1)
+def api_rows(source, query):
+    start = max(_int_param(query, 'start', 0), 0)
+    stop = min(_int_param(query, 'stop', start + 50), start + API_PAGE_ROWS_MAX)
+    sort = query.get('sort', [None])[-1]
+    if sort is not None and sort not in source.columns:
+        raise ValueError(f"Unknown sort column: {sort}")
+    view, body = _view(source, query)
+    if sort is not None:
+        view = view.sorted(sort, query.get('descending', ['0'])[-1] in ('0', 'false', ''))
+    total = view_result(view, 'counts')['rows']
+    return {**body, 'total_rows': total, 'start': start, 'rows': view.page(start, max(stop, start))}
+
+
+def api_popular(source, query):
+    return [{'filters': filters, 'requests': count} for filters, count in popular_views.top(_int_param(query, 'n', 20))]
+
+
+API_ENDPOINTS = {
+    '/api/status': api_status,
+    '/api/kpis': api_kpis,
+    '/api/charts': api_charts,
+    '/api/facets': api_facets,
+    '/api/rows': api_rows,
+    '/api/popular': api_popular,
+}
+
+
+# JSON over GET. Every response carries an ETag hashed from its body; a request
+# whose If-None-Match lists it gets 304 Not Modified without the body. Export
+# links (/exports/<token>) are written to a temporary file and streamed from it.
+class ClaimsApiHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.startswith('/exports/'):
+            self._send_export(url.path[len('/exports/'):])
+            return
+        endpoint = API_ENDPOINTS.get(url.path)
+        if endpoint is None:
+            self._send_json(404, {'error': f"Unknown endpoint {url.path}", 'endpoints': sorted(API_ENDPOINTS)})
+            return
+        try:
+            body = endpoint(get_claims_source(), parse_qs(url.query))
+        except ValueError as e:
+            self._send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            print(f"Error serving {self.path}: {e}")
+            self._send_json(500, {'error': str(e)})
+            return
+        self._send_json(200, body)
+
+    def _send_json(self, status, body):
+        content = json.dumps(_json_value(body), separators=(',', ':')).encode()
+        etag = '"' + hashlib.sha1(content).hexdigest() + '"'
+        matches = [tag.strip() for tag in self.headers.get('If-None-Match', '').split(",")]
+        if status == 200 and (etag in matches or '*' in matches):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _send_export(self, token):
+        link = export_links.get(token)
+        if link is None:
+            self._send_json(404, {'error': "This download link has expired; reload the dashboard"})
+            return
+        try:
+            with stage('export'):
+                path = write_export_file(link.view, link.fmt, link.compress)
+        except Exception as e:
+            print(f"Error exporting {link.file_name}: {e}")
+            self._send_json(500, {'error': str(e)})
+            return
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', export_mime(link.fmt, link.compress))
+            self.send_header('Content-Length', str(os.path.getsize(path)))
+            self.send_header('Content-Disposition', f'attachment; filename="{link.file_name}"')
+            self.end_headers()
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, self.wfile, EXPORT_COPY_BYTES)
+        finally:
+            os.unlink(path)
+
+    def log_message(self, *args):
+        pass
+
+
+_started = False
+_server_url = None
+_start_lock = threading.Lock()
+
+
+# Start the popular-view warm-up and, when port is set, the API server, once per
+# process. Returns the server, or None when it is disabled or already started.
+def start_claims_api(port=API_PORT, warm_views=WARM_VIEWS, host=API_HOST):
+    global _started, _server_url
+    with _start_lock:
+        if _started:
+            return None
+        _started = True
+        if warm_views:
+            warmer.views = warm_views
+            register_load_hook(lambda dataset: warmer.wake())
+            warmer.start()
+        if not port:
+            return None
+        try:
+            server = ThreadingHTTPServer((host, port), ClaimsApiHandler)
+        except OSError as e:
+            print(f"Claims API not started on port {port}: {e}")
+            return None
+        threading.Thread(target=server.serve_forever, name='claims-api', daemon=True).start()
+        _server_url = (API_URL or f"http://localhost:{port}").rstrip("/")
+        return server
+
+
+# Download link for an export of a view, or None when the API server is not
+# running or CLAIMS_API_URL is not set. key names the view (data version,
+# filters, sort, format), so reruns showing the same view get the same link.
+def export_url(key, view, fmt, compress, file_name):
+    if _server_url is None or not API_URL:
+        return None
+    return f"{_server_url}/exports/{export_links.register(key, view, fmt, compress, file_name)}"
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Serve the dashboard aggregates as a local JSON API')
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=API_PORT or 8600,
+        help='Port to listen on (default: CLAIMS_API_PORT or 8600)'
+    )
+    parser.add_argument(
+        '--warm-views',
+        type=int,
+        default=WARM_VIEWS,
+        help=f'Most requested views to precompute at startup and after reloads (default: {WARM_VIEWS})'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    server = start_claims_api(args.port, args.warm_views)
+    if server is None:
+        raise SystemExit(1)
+    print(f"Serving the claims API at {_server_url}/api/status")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        popular_views.save()
+
+if __name__ == "__main__":
+    main()
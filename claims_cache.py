@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# LRU cache shared between sessions, with hit/miss counters. The least recently
+# used entries are dropped beyond max_entries, or once the sizes of the values
+# (size(value)) add up to more than max_bytes, and entries expire ttl_seconds
+# after they were stored; a bound left as None does not apply. A value larger
+# than max_bytes on its own is returned to the caller but not kept. Values are
+# shared between sessions and must not be mutated by callers.
+class LruCache:
+    def __init__(self, max_entries=None, max_bytes=None, ttl_seconds=None, size=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.size = size
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # key -> (stored at, size, value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_seconds is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                self.bytes -= entry[1]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value):
+        nbytes = self.size(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= self._entries.pop(key)[1]
+            if self.max_bytes is not None and nbytes > self.max_bytes:
+                return
+            self._entries[key] = (time.monotonic(), nbytes, value)
+            self.bytes += nbytes
+            while self._over_budget():
+                _, (_, evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def _over_budget(self):
+        return (
+            (self.max_entries is not None and len(self._entries) > self.max_entries)
+            or (self.max_bytes is not None and self.bytes > self.max_bytes)
+        )
+
+    # Cached value for key, computing it on a miss. Computation happens outside
+    # the lock, so concurrent misses on the same key may both compute.
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from claims_cache import LruCache
+
+# x-axis titles of the monthly trend for each bucket the point budget can select
+TREND_BUCKET_TITLES = {'month': "Month-Year", 'quarter': "Quarter", 'year': "Year"}
+
+CHART_LAYOUT = dict(plot_bgcolor="#ffffff", paper_bgcolor="#f0f2f6")
+
+# Bytes of serialized figures kept across sessions; set CLAIMS_FIGURE_CACHE_MB to change
+FIGURE_CACHE_BYTES = int(float(os.environ.get('CLAIMS_FIGURE_CACHE_MB', '32')) * 1024 ** 2)
+
+
+# Figures of the dashboard charts, built from chart aggregates (see claims_aggregates)
+def status_figure(aggregates):
+    fig = px.bar(
+        aggregates['status_counts'], x='claim_status', y='count', title="Claims by Status",
+        color='claim_status', color_discrete_sequence=px.colors.sequential.Plasma
+    )
+    fig.update_layout(**CHART_LAYOUT)
+    return fig
+
+
+def claims_over_time_figure(aggregates):
+    fig = px.line(
+        aggregates['claims_over_time'], x='claim_received_date', y='claim_count',
+        title="Claims Over Time", color_discrete_sequence=px.colors.sequential.Viridis
+    )
+    fig.update_layout(**CHART_LAYOUT)
+    if aggregates['time_bucket'] != 'day':
+        fig.update_xaxes(title=f"claim_received_date (per {aggregates['time_bucket']})")
+    return fig
+
+
+def status_distribution_figure(aggregates):
+    fig = px.pie(
+        aggregates['status_counts'], names='claim_status', values='count',
+        title="Claim Status Distribution", hole=0.3
+    )
+    fig.update_layout(**CHART_LAYOUT)
+    return fig
+
+
+def line_of_business_figure(aggregates):
+    fig = px.bar(
+        aggregates['line_of_business_counts'],
+        y='line_of_business',
+        x='count',
+        orientation='h',
+        title="Claims by Line of Business",
+        color='line_of_business'
+    )
+    fig.update_layout(**CHART_LAYOUT, showlegend=False)
+    fig.update_xaxes(title="Count")
+    fig.update_yaxes(title="Line of Business")
+    return fig
+
+
+def monthly_trend_figure(aggregates):
+    fig = px.bar(
+        aggregates['monthly_status_counts'],
+        x='month_year',
+        y='count',
+        color='claim_status',
+        title="Monthly Claim Status Trend (Open vs Closed)",
+        barmode='group'
+    )
+    monthly_totals = aggregates['monthly_totals']
+    fig.add_scatter(
+        x=monthly_totals['month_year'],
+        y=monthly_totals['count'],
+        mode='lines+markers',
+        name='Total Claims Trend',
+        line=dict(color='blue', width=2)
+    )
+    fig.update_layout(
+        **CHART_LAYOUT,
+        xaxis_title=TREND_BUCKET_TITLES[aggregates['trend_bucket']],
+        yaxis_title="Number of Claims",
+        xaxis_tickangle=-45
+    )
+    return fig
+
+
+# Chart id -> figure builder, in the order the dashboard lays them out
+CHART_FIGURES = {
+    'status': status_figure,
+    'claims_over_time': claims_over_time_figure,
+    'status_distribution': status_distribution_figure,
+    'line_of_business': line_of_business_figure,
+    'monthly_trend': monthly_trend_figure,
+}
+
+# Aggregates each chart is drawn from; its figure depends on nothing else
+CHART_INPUTS = {
+    'status': ['status_counts'],
+    'claims_over_time': ['claims_over_time', 'time_bucket'],
+    'status_distribution': ['status_counts'],
+    'line_of_business': ['line_of_business_counts'],
+    'monthly_trend': ['monthly_status_counts', 'monthly_totals', 'trend_bucket'],
+}
+
+
+# Content hash of the aggregates a chart is drawn from: column names, dtypes and
+# values of each frame, so equal aggregates from any state or version share a key
+def aggregate_hash(aggregates, inputs):
+    digest = hashlib.sha1()
+    for name in inputs:
+        value = aggregates[name]
+        digest.update(name.encode())
+        if isinstance(value, pd.DataFrame):
+            digest.update(repr([(col, str(dtype)) for col, dtype in value.dtypes.items()]).encode())
+            digest.update(pd.util.hash_pandas_object(value, index=False).to_numpy().tobytes())
+        else:
+            digest.update(repr(value).encode())
+    return digest.hexdigest()
+
+
+# Serialized figure JSON shared by every session, bounded by total size
+figure_cache = LruCache(max_bytes=FIGURE_CACHE_BYTES)
+
+
+# Serialized JSON of a chart's figure, built only when no equal aggregates have
+# been drawn under the current plotly template
+def figure_spec(chart, aggregates):
+    key = (chart, aggregate_hash(aggregates, CHART_INPUTS[chart]), pio.templates.default)
+    return figure_cache.get_or_compute(key, lambda: pio.to_json(CHART_FIGURES[chart](aggregates), validate=False))
+
+
+# Figure for st.plotly_chart from the cached JSON. The spec was validated when it
+# was built, so it is loaded without plotly's validation, which is most of the
+# cost of constructing a figure.
+def cached_figure(chart, aggregates):
+    return go.Figure(json.loads(figure_spec(chart, aggregates)), _validate=False)
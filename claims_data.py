@@ -0,0 +1,739 @@
+import glob
+import io
+import json
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+import warnings
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from pandas.tseries.api import guess_datetime_format
+
+from claims_instrumentation import stage
+
+CLAIMS_CSV = "Claims.csv"
+
+# Date columns parsed at load time; every one except update_date has a sidebar range filter
+DATE_COLUMNS = [
+    'claim_received_date', 'claim_loss_date', 'claim_finalised_date',
+    'original_verified_date_of_loss_time', 'last_verified_date_of_loss_time',
+    'catastrophe_valid_from_date_time', 'catastrophe_valid_to_date_time', 'update_date'
+]
+FILTER_DATE_COLUMNS = [col for col in DATE_COLUMNS if col != 'update_date']
+
+# Text columns offered as multiselect filters in the sidebar
+TEXT_FILTER_COLUMNS = [
+    'source_system', 'general_nature_of_loss', 'line_of_business', 'claim_status',
+    'fault_rating', 'fault_categorisation'
+]
+
+
+# Optional leakage columns behind the Metrics Overview cards: two yes/no flags
+# and two dollar amounts
+KPI_FLAG_COLUMNS = ['leakage_opportunity', 'opportunity_actioned']
+KPI_AMOUNT_COLUMNS = ['potential_leakage_amount', 'incurred_amount']
+
+# Declared in-memory schema of the claims frame. Filter columns are categoricals so
+# isin/groupby run on integer codes, and claim_number is an Arrow-backed string.
+# pandas has no datetime64[D], so dates use datetime64[s] with the time of day dropped.
+CLAIM_NUMBER_DTYPE = pd.StringDtype('pyarrow')
+DATE_DTYPE = 'datetime64[s]'
+# Layout of the dates in the extract; columns in another layout fall back to inference
+DATE_FORMAT = os.environ.get('CLAIMS_DATE_FORMAT', '%Y-%m-%d')
+CLAIMS_SCHEMA = {
+    'claim_number': CLAIM_NUMBER_DTYPE,
+    **{col: 'category' for col in TEXT_FILTER_COLUMNS},
+    **{col: DATE_DTYPE for col in DATE_COLUMNS},
+    **{col: 'boolean' for col in KPI_FLAG_COLUMNS},
+    **{col: 'float64' for col in KPI_AMOUNT_COLUMNS},
+}
+
+_TRUE_FLAGS = {'true', 't', 'yes', 'y', '1'}
+
+# dtypes applied while parsing the CSV, before the schema is enforced
+CSV_DTYPES = {'claim_number': str, **{col: 'category' for col in TEXT_FILTER_COLUMNS}}
+
+# Rows parsed per chunk when ingesting a CSV. One chunk is parsed at a time, so
+# peak memory is the finished frame plus what parsing this many rows takes.
+INGEST_CHUNK_ROWS = int(os.environ.get('CLAIMS_INGEST_CHUNK_ROWS', '100000'))
+
+# Rows read per step while looking for the first value of each date column; the
+# values are nearly always in the first step, so this stays small
+DATE_FORMAT_SCAN_ROWS = 4096
+
+# Processes parsing a CSV extract at load time. Files under LOAD_PARALLEL_MIN_BYTES
+# are read in-process, where starting the pool would cost more than it saves.
+LOAD_WORKERS = int(os.environ.get('CLAIMS_LOAD_WORKERS', str(os.cpu_count() or 1)))
+LOAD_PARALLEL_MIN_BYTES = 32 * 1024 ** 2
+
+# With several server processes, set CLAIMS_SHARED_DIR (ideally on tmpfs such as
+# /dev/shm) and run publish_claims.py: it loads the claims once and publishes them
+# there as versioned files that every worker memory-maps instead of loading its own copy
+SHARED_DIR = os.environ.get('CLAIMS_SHARED_DIR', '')
+SHARED_SUFFIX = ".claims.arrow"
+SHARED_CURRENT = "CURRENT"
+SHARED_KEEP_VERSIONS = 2
+_SHARED_META = b'claims'
+
+
+# Ingestion progress after each chunk: rows and bytes read so far, the file size
+# and the seconds elapsed
+class IngestProgress(namedtuple('IngestProgress', ['rows', 'bytes_read', 'total_bytes', 'seconds'])):
+    @property
+    def fraction(self):
+        return self.bytes_read / self.total_bytes if self.total_bytes else 1.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.bytes_read / 1024 ** 2 / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.rows:,} rows, {self.bytes_read / 1024 ** 2:,.0f}/{self.total_bytes / 1024 ** 2:,.0f} MB"
+            f" ({self.fraction:.0%}) - {self.rows_per_second:,.0f} rows/s, {self.mb_per_second:,.1f} MB/s"
+        )
+
+
+# Yes/no flags arrive as booleans, 0/1 or text such as "Y"/"N"
+def _parse_flags(values):
+    if pd.api.types.is_bool_dtype(values):
+        return values.astype('boolean')
+    if pd.api.types.is_numeric_dtype(values):
+        return (values != 0).astype('boolean').mask(values.isna())
+    flags = values.astype('string').str.strip().str.lower().isin(_TRUE_FLAGS)
+    return flags.astype('boolean').mask(values.isna())
+
+
+# Format of a date column, decided from its first value as pandas does for a
+# whole column: DATE_FORMAT when the value matches it, else the format guessed
+# from the value, else 'mixed' (every value parsed on its own). Values in another
+# layout than the first one become NaT.
+def claim_date_format(first_value):
+    if pd.isna(first_value) or pd.notna(pd.to_datetime(first_value, format=DATE_FORMAT, errors='coerce')):
+        return DATE_FORMAT
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        return guess_datetime_format(str(first_value)) or 'mixed'
+
+
+# Date formats of a CSV extract, worked out once for the whole file so that every
+# chunk (or worker) parses a column the same way whatever rows it holds
+def claim_date_formats(path, scan_rows=DATE_FORMAT_SCAN_ROWS):
+    columns = [col for col in pd.read_csv(path, nrows=0).columns if col in DATE_COLUMNS]
+    first_values = {}
+    if columns:
+        for chunk in pd.read_csv(path, usecols=columns, dtype=str, chunksize=scan_rows):
+            for col in columns:
+                if col not in first_values and chunk[col].notna().any():
+                    first_values[col] = chunk[col].dropna().iloc[0]
+            if len(first_values) == len(columns):
+                break
+    return {col: claim_date_format(first_values.get(col)) for col in columns}
+
+
+# Parse date text with the column's format; without one, the format is decided
+# from the first value of these values
+def parse_claim_dates(values, date_format=None):
+    if date_format is None:
+        present = values.dropna()
+        date_format = claim_date_format(present.iloc[0] if len(present) else None)
+    return pd.to_datetime(values, format=date_format, errors='coerce')
+
+
+# Coerce a frame to CLAIMS_SCHEMA; integer columns outside the schema are downcast.
+# date_formats ({column: format}) is needed when df is one chunk of a larger file.
+def apply_claims_schema(df, date_formats=None):
+    date_formats = date_formats or {}
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            values = df[col]
+            if not pd.api.types.is_datetime64_any_dtype(values):
+                values = parse_claim_dates(values, date_formats.get(col))
+            df[col] = values.dt.normalize().astype(DATE_DTYPE)
+        elif col in KPI_FLAG_COLUMNS:
+            df[col] = _parse_flags(df[col])
+        elif col in KPI_AMOUNT_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        elif col in CLAIMS_SCHEMA:
+            df[col] = df[col].astype(CLAIMS_SCHEMA[col])
+        elif pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+    return df
+
+
+# Raw CSV chunks of chunk_rows rows; progress(IngestProgress) is called once each
+# chunk has been handled by the caller
+def _iter_csv_chunks(path, chunk_rows, progress=None):
+    total_bytes = os.path.getsize(path)
+    start = time.perf_counter()
+    rows = 0
+    with open(path, 'rb') as f:
+        for chunk in pd.read_csv(f, dtype=CSV_DTYPES, chunksize=chunk_rows):
+            yield chunk
+            rows += len(chunk)
+            if progress is not None:
+                progress(IngestProgress(rows, f.tell(), total_bytes, time.perf_counter() - start))
+
+
+# The extract as chunks already coerced to the declared schema
+def iter_claims_csv(path=CLAIMS_CSV, chunk_rows=INGEST_CHUNK_ROWS, progress=None):
+    date_formats = claim_date_formats(path)
+    for chunk in _iter_csv_chunks(path, chunk_rows, progress):
+        with stage('load/coerce_schema'):
+            chunk = apply_claims_schema(chunk, date_formats)
+        yield chunk
+
+
+# Upper bound on the data rows of a CSV file: its line count, less the header.
+# Quoted line breaks and blank lines only make it larger.
+def _csv_row_capacity(path):
+    lines = 1
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(16 * 1024 ** 2), b''):
+            lines += block.count(b'\n')
+    return lines
+
+
+# Typed frame assembled from typed chunks in order. Columns of the declared
+# schema are copied into arrays allocated once for capacity rows, so each chunk
+# can be released as soon as it is appended and the result is never built as a
+# second full copy: category codes are remapped onto categories merged across
+# chunks (sorted at the end), booleans keep a values and a mask array, and
+# claim numbers keep each chunk's Arrow buffers. Columns outside the schema
+# may change dtype between chunks and are concatenated at the end.
+class _FrameBuilder:
+    def __init__(self, capacity):
+        self.capacity = max(capacity, 1)
+        self.rows = 0
+        self._columns = None
+
+    def _start(self, chunk):
+        self._columns = {}
+        for col in chunk.columns:
+            dtype = chunk[col].dtype
+            if col not in CLAIMS_SCHEMA:
+                self._columns[col] = ('other', [])
+            elif isinstance(dtype, pd.CategoricalDtype):
+                categories = chunk[col].cat.categories[:0]
+                self._columns[col] = ('category', [np.empty(self.capacity, dtype=np.int32), categories])
+            elif isinstance(dtype, pd.BooleanDtype):
+                arrays = [np.empty(self.capacity, dtype=bool), np.empty(self.capacity, dtype=bool)]
+                self._columns[col] = ('boolean', arrays)
+            elif dtype == CLAIM_NUMBER_DTYPE:
+                self._columns[col] = ('string', [])
+            else:
+                self._columns[col] = ('numpy', [np.empty(self.capacity, dtype=dtype)])
+
+    # Grow every preallocated array to hold at least rows rows
+    def _reserve(self, rows):
+        if rows <= self.capacity:
+            return
+        self.capacity = max(rows, self.capacity * 3 // 2)
+        for kind, parts in self._columns.values():
+            if kind in ('category', 'boolean', 'numpy'):
+                for i, array in enumerate(parts):
+                    if isinstance(array, np.ndarray):
+                        grown = np.empty(self.capacity, dtype=array.dtype)
+                        grown[:self.rows] = array[:self.rows]
+                        parts[i] = grown
+
+    def append(self, chunk):
+        if self._columns is None:
+            self._start(chunk)
+        n = len(chunk)
+        self._reserve(self.rows + n)
+        at = slice(self.rows, self.rows + n)
+        for col, (kind, parts) in self._columns.items():
+            values = chunk[col]
+            if kind == 'other':
+                parts.append(values)
+            elif kind == 'string':
+                parts.append(pa.array(values.array))
+            elif kind == 'boolean':
+                parts[0][at] = values.to_numpy(dtype=bool, na_value=False)
+                parts[1][at] = values.isna().to_numpy()
+            elif kind == 'numpy':
+                parts[0][at] = values.to_numpy()
+            else:
+                chunk_categories = values.cat.categories
+                known = parts[1].get_indexer(chunk_categories)
+                if (known < 0).any():
+                    parts[1] = parts[1].append(chunk_categories[known < 0])
+                    known = parts[1].get_indexer(chunk_categories)
+                # code -1 (missing) picks the trailing -1
+                mapping = np.append(known, -1).astype(np.int32)
+                parts[0][at] = mapping[values.cat.codes.to_numpy()]
+        self.rows += n
+
+    # Arrays trimmed to the rows appended; copied when most of the capacity is unused
+    def _trimmed(self, array):
+        return array[:self.rows].copy() if self.rows < self.capacity * 7 // 8 else array[:self.rows]
+
+    def frame(self):
+        columns = {}
+        for col, (kind, parts) in (self._columns or {}).items():
+            if kind == 'other':
+                columns[col] = pd.concat(parts, ignore_index=True)
+            elif kind == 'string':
+                columns[col] = pd.arrays.ArrowStringArray(pa.chunked_array(parts))
+            elif kind == 'boolean':
+                columns[col] = pd.arrays.BooleanArray(self._trimmed(parts[0]), self._trimmed(parts[1]))
+            elif kind == 'numpy':
+                columns[col] = self._trimmed(parts[0])
+            else:
+                codes, categories = self._trimmed(parts[0]), parts[1]
+                order = categories.argsort()
+                rank = np.empty(len(categories) + 1, dtype=np.int32)
+                rank[order] = np.arange(len(categories), dtype=np.int32)
+                rank[-1] = -1
+                np.take(rank, codes, out=codes)
+                dtype = pd.CategoricalDtype(categories[order])
+                columns[col] = pd.Categorical.from_codes(codes, dtype=dtype)
+        return pd.DataFrame(columns, copy=False)
+
+
+# Read the claims extract and coerce it to the declared schema chunk by chunk.
+# Peak memory is the finished frame plus about one chunk: the raw text of the
+# whole file is never held, and each typed chunk is released once appended.
+def read_claims_csv(path=CLAIMS_CSV, chunk_rows=INGEST_CHUNK_ROWS, progress=None):
+    builder = _FrameBuilder(_csv_row_capacity(path))
+    for chunk in iter_claims_csv(path, chunk_rows, progress):
+        builder.append(chunk)
+        del chunk
+    return builder.frame()
+
+
+# The header line and byte ranges of about `parts` runs of whole data lines, or
+# None when the file quotes fields (a quoted field may hold a line break)
+def _csv_ranges(path, parts):
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data.find(b'"') >= 0:
+                return None
+        header = f.readline()
+        start = f.tell()
+        step = max((size - start) // parts, 1)
+        ranges = []
+        while start < size:
+            f.seek(min(start + step, size))
+            f.readline()
+            ranges.append((start, f.tell()))
+            start = f.tell()
+    return header, ranges
+
+
+# Parse one range of data lines in a worker process
+def _read_csv_range(path, header, date_formats, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return apply_claims_schema(pd.read_csv(io.BytesIO(header + data), dtype=CSV_DTYPES), date_formats)
+
+
+# Read the claims extract on a pool of processes, each parsing and typing a run of
+# whole lines. The pieces are appended in file order as read_claims_csv appends
+# its chunks, so the frame is identical to a single-process read.
+def read_claims_csv_parallel(path=CLAIMS_CSV, workers=LOAD_WORKERS, progress=None):
+    total_bytes = os.path.getsize(path)
+    split = _csv_ranges(path, workers * 4) if workers > 1 else None
+    if split is None or not split[1]:
+        return read_claims_csv(path, progress=progress)
+
+    header, ranges = split
+    start = time.perf_counter()
+    date_formats = claim_date_formats(path)
+    builder = _FrameBuilder(_csv_row_capacity(path))
+    # Pieces finishing out of order wait here until the ones before them are appended
+    pending = {}
+    builder_next = 0
+    rows = bytes_read = 0
+    # Forking the threaded Streamlit server can leave a worker holding a copy of a
+    # lock another thread had taken; workers start from a clean forkserver instead
+    start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(start_method)) as pool:
+        futures = {pool.submit(_read_csv_range, path, header, date_formats, *byte_range): i for i, byte_range in enumerate(ranges)}
+        for future in as_completed(futures):
+            i = futures[future]
+            pending[i] = future.result()
+            rows += len(pending[i])
+            bytes_read += ranges[i][1] - ranges[i][0]
+            while builder_next in pending:
+                builder.append(pending.pop(builder_next))
+                builder_next += 1
+            if progress is not None:
+                progress(IngestProgress(rows, bytes_read, total_bytes, time.perf_counter() - start))
+    return builder.frame()
+
+
+# Columnar snapshot written next to the CSV, e.g. Claims.csv -> Claims.arrow
+def snapshot_path_for(csv_path):
+    return os.path.splitext(csv_path)[0] + ".arrow"
+
+
+# Dictionary array for a chunk of a filter column, encoded against the values
+# seen in earlier chunks (value -> index, extended in place) so that every chunk
+# shares one growing dictionary
+def _dictionary_array(values, dictionary):
+    values = values.astype('category')
+    for value in values.cat.categories:
+        dictionary.setdefault(value, len(dictionary))
+    codes = values.cat.codes.to_numpy()
+    mapping = np.array([dictionary[value] for value in values.cat.categories] + [0], dtype=np.int32)
+    indices = pa.array(mapping[codes], mask=codes < 0, type=pa.int32())
+    return pa.DictionaryArray.from_arrays(indices, pa.array(list(dictionary), type=pa.string()))
+
+
+# Typed Arrow table for a raw CSV frame: date32 dates, dictionary-encoded
+# filter columns and claim_number as a string. Pass the same dictionaries and
+# date formats for every chunk of one file.
+def claims_arrow_table(df, dictionaries=None, date_formats=None):
+    dictionaries = {} if dictionaries is None else dictionaries
+    date_formats = date_formats or {}
+    arrays = {}
+    for col in df.columns:
+        if col in DATE_COLUMNS:
+            arrays[col] = pa.array(parse_claim_dates(df[col], date_formats.get(col))).cast(pa.date32())
+        elif col in TEXT_FILTER_COLUMNS:
+            arrays[col] = _dictionary_array(df[col], dictionaries.setdefault(col, {}))
+        elif col == 'claim_number':
+            arrays[col] = pa.array(df[col], type=pa.string(), from_pandas=True)
+        else:
+            arrays[col] = pa.array(df[col], from_pandas=True)
+    return pa.table(arrays)
+
+
+# Convert the CSV extract into an uncompressed Arrow IPC file that loads without
+# parsing, one record batch per chunk. Filter columns grow their dictionary
+# with delta batches. Columns outside the schema take their type from the first
+# chunk (all-empty ones become strings) and later chunks are cast to it.
+def write_claims_snapshot(csv_path=CLAIMS_CSV, snapshot_path=None, chunk_rows=INGEST_CHUNK_ROWS, progress=None):
+    snapshot_path = snapshot_path or snapshot_path_for(csv_path)
+    dictionaries = {}
+    date_formats = claim_date_formats(csv_path)
+    schema = None
+    rows = 0
+
+    # Write beside the target and swap it in, so readers never see a partial file
+    tmp_path = snapshot_path + ".tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        writer = None
+        try:
+            for chunk in _iter_csv_chunks(csv_path, chunk_rows, progress):
+                table = claims_arrow_table(chunk, dictionaries, date_formats)
+                if writer is None:
+                    schema = table.schema
+                    for i, field in enumerate(schema):
+                        if pa.types.is_null(field.type):
+                            schema = schema.set(i, field.with_type(pa.string()))
+                    options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                    writer = pa.ipc.new_file(sink, schema, options=options)
+                writer.write_table(table.cast(schema))
+                rows += table.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+    os.replace(tmp_path, snapshot_path)
+    return rows
+
+
+# Load the snapshot without parsing any text. The file is memory-mapped, but
+# to_pandas, the category reordering and the schema all copy into private memory,
+# so each process still holds its own frame; to share one copy between workers,
+# publish it to CLAIMS_SHARED_DIR with publish_claims.py (attach_shared_frame)
+def read_claims_snapshot(path):
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    df = table.to_pandas(date_as_object=False, types_mapper={pa.string(): CLAIM_NUMBER_DTYPE}.get)
+    # Dictionaries are in order of first appearance; sort them as the CSV reader does
+    for col in TEXT_FILTER_COLUMNS:
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+    return apply_claims_schema(df)
+
+
+# Prefer the snapshot when it is at least as new as the CSV (or the CSV is gone)
+def resolve_claims_source(csv_path=CLAIMS_CSV):
+    if csv_path.endswith(SHARED_SUFFIX):
+        return csv_path
+    snapshot_path = snapshot_path_for(csv_path)
+    if not os.path.exists(snapshot_path):
+        return csv_path
+    if os.path.exists(csv_path) and os.stat(csv_path).st_mtime_ns > os.stat(snapshot_path).st_mtime_ns:
+        return csv_path
+    return snapshot_path
+
+
+# Arrow table of a typed frame in pandas' own memory layout, so that
+# attach_shared_frame can wrap the buffers without copying: category codes with
+# the categories kept in the field metadata, dates as int64 seconds (NaT included),
+# nullable booleans as a values and a mask column, and numpy columns as they are.
+# Anything else is stored as plain Arrow data and converted on attach.
+def shared_claims_table(frame):
+    fields, arrays = [], []
+
+    def add(name, array, kind, **meta):
+        metadata = {_SHARED_META: json.dumps({'kind': kind, **meta}).encode()}
+        fields.append(pa.field(name, array.type, metadata=metadata))
+        arrays.append(array)
+
+    for col in frame.columns:
+        values = frame[col]
+        dtype = values.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            add(col, pa.array(values.cat.codes.to_numpy()), 'category',
+                categories=values.cat.categories.tolist(), ordered=bool(dtype.ordered))
+        elif isinstance(dtype, pd.BooleanDtype):
+            add(col, pa.array(values.to_numpy(dtype=np.uint8, na_value=0)), 'boolean')
+            add(f"{col}#mask", pa.array(values.isna().to_numpy().view(np.uint8)), 'mask')
+        elif isinstance(dtype, np.dtype) and dtype.kind == 'M':
+            add(col, pa.array(values.to_numpy().view(np.int64)), 'datetime', dtype=str(dtype))
+        elif isinstance(dtype, np.dtype) and dtype.kind in 'biuf':
+            add(col, pa.array(values.to_numpy()), 'numpy')
+        elif dtype == CLAIM_NUMBER_DTYPE:
+            add(col, pa.array(values, type=pa.large_string(), from_pandas=True), 'string')
+        else:
+            add(col, pa.array(values, from_pandas=True), 'arrow')
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields)).combine_chunks()
+
+
+# Zero-copy numpy view of a single-chunk column
+def _shared_values(column):
+    return column.chunk(0).to_numpy(zero_copy_only=True) if column.num_chunks else column.to_numpy()
+
+
+# Frame whose columns are read-only views into the memory-mapped shared file at
+# path; only columns stored as plain Arrow data are copied
+def attach_shared_frame(path):
+    table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+    columns = {}
+    for field in table.schema:
+        meta = json.loads(field.metadata[_SHARED_META])
+        kind = meta['kind']
+        column = table.column(field.name)
+        if kind == 'category':
+            dtype = pd.CategoricalDtype(meta['categories'], ordered=meta['ordered'])
+            columns[field.name] = pd.Categorical.from_codes(_shared_values(column), dtype=dtype)
+        elif kind == 'boolean':
+            mask = _shared_values(table.column(f"{field.name}#mask")).view(bool)
+            columns[field.name] = pd.arrays.BooleanArray(_shared_values(column).view(bool), mask)
+        elif kind == 'datetime':
+            columns[field.name] = _shared_values(column).view(meta['dtype'])
+        elif kind == 'numpy':
+            columns[field.name] = _shared_values(column)
+        elif kind == 'string':
+            columns[field.name] = pd.arrays.ArrowStringArray(column)
+        elif kind == 'arrow':
+            columns[field.name] = column.to_pandas()
+    return pd.DataFrame(columns, copy=False)
+
+
+# Publish the frame as the next version in directory and point CURRENT at it.
+# Workers still mapping an older version keep reading it; files beyond the
+# newest keep versions are removed (open mappings survive the unlink).
+def publish_shared_frame(frame, directory=SHARED_DIR, keep=SHARED_KEEP_VERSIONS):
+    os.makedirs(directory, exist_ok=True)
+    table = shared_claims_table(frame)
+    path = os.path.join(directory, f"claims-{time.time_ns()}{SHARED_SUFFIX}")
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=max(table.num_rows, 1))
+    os.replace(tmp_path, path)
+
+    pointer = os.path.join(directory, SHARED_CURRENT)
+    with open(pointer + ".tmp", 'w') as f:
+        f.write(os.path.basename(path))
+    os.replace(pointer + ".tmp", pointer)
+
+    versions = sorted(glob.glob(os.path.join(directory, f"claims-*{SHARED_SUFFIX}")))
+    for old_path in versions[:-max(keep, 1)]:
+        os.remove(old_path)
+    return path
+
+
+# Path of the version CURRENT points at; FileNotFoundError until one is published
+def current_shared_path(directory=SHARED_DIR):
+    with open(os.path.join(directory, SHARED_CURRENT)) as f:
+        return os.path.join(directory, f.read().strip())
+
+
+# One loaded copy of the claims table, shared by every session in the process.
+# The frame must be treated as read-only: callers copy before mutating it.
+class ClaimsDataset:
+    def __init__(self, frame, source, signature, version, load_seconds):
+        self.frame = frame
+        self.source = source
+        self.signature = signature
+        self.version = version
+        self.load_seconds = load_seconds
+        self.loaded_at = datetime.now()
+        self.memory_bytes = int(frame.memory_usage(deep=True).sum())
+        # Latest update_date loaded; an incremental refresh reads only newer rows
+        self.high_water_mark = frame['update_date'].max() if 'update_date' in frame.columns else pd.NaT
+        self._derived = {}
+        self._derived_lock = threading.Lock()
+
+    # Build a structure derived from this dataset version (filter indexes,
+    # pre-aggregates, ...) once and hand the same instance to every session
+    def derived(self, name, build):
+        with self._derived_lock:
+            if name not in self._derived:
+                with stage(f'build/{name}'):
+                    self._derived[name] = build(self)
+            return self._derived[name]
+
+    # The next version of this dataset after an upsert. Derived structures with a
+    # registered delta update are carried over and patched for the changed rows;
+    # the rest are rebuilt on first use.
+    def updated(self, frame, delta, version):
+        dataset = ClaimsDataset(frame, self.source, self.signature, version, 0.0)
+        with self._derived_lock:
+            derived = dict(self._derived)
+        for name, value in derived.items():
+            update = _delta_updates.get(name)
+            if update is None:
+                continue
+            try:
+                dataset._derived[name] = update(value, dataset, delta)
+            except Exception as e:
+                print(f"Error updating {name} for the changed rows, rebuilding it: {e}")
+        return dataset
+
+    def metrics(self):
+        return {
+            'source': self.source,
+            'version': self.version,
+            'rows': len(self.frame),
+            'columns': len(self.frame.columns),
+            'load_seconds': self.load_seconds,
+            'memory_bytes': self.memory_bytes,
+            'loaded_at': self.loaded_at.isoformat(timespec='seconds'),
+            'high_water_mark': None if pd.isna(self.high_water_mark) else self.high_water_mark.isoformat(),
+        }
+
+
+# Rows changed by an upsert: positions overwritten in place (sorted), the row
+# count before the upsert (rows from there on were appended) and the previous
+# values of the overwritten rows
+ClaimsDelta = namedtuple('ClaimsDelta', ['changed', 'n_old', 'old_rows'])
+
+
+# Positions of every overwritten or appended row
+def delta_positions(delta, n_rows):
+    return np.concatenate([delta.changed, np.arange(delta.n_old, n_rows)])
+
+
+_dataset_lock = threading.Lock()
+_dataset = None
+_dataset_version = 0
+_load_hooks = []
+_delta_updates = {}
+
+
+# Run hook(dataset) after every (re)load, e.g. to build pre-aggregates up front
+def register_load_hook(hook):
+    if hook not in _load_hooks:
+        _load_hooks.append(hook)
+
+
+# update(value, dataset, delta) returns the derived structure called name for the
+# upserted dataset, given its value for the previous version
+def register_delta_update(name, update):
+    _delta_updates[name] = update
+
+
+def _run_load_hooks(dataset):
+    for hook in _load_hooks:
+        try:
+            hook(dataset)
+        except Exception as e:
+            print(f"Error in dataset load hook {hook.__name__}: {e}")
+
+
+# A file is considered unchanged while its mtime and size stay the same
+def _file_signature(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _is_current(dataset, path, signature):
+    return dataset is not None and dataset.source == path and dataset.signature == signature
+
+
+def _load_dataset(path, signature):
+    global _dataset_version
+    start = time.perf_counter()
+    if path.endswith(SHARED_SUFFIX):
+        with stage('load/attach_shared'):
+            frame = attach_shared_frame(path)
+    elif path.endswith(".arrow"):
+        with stage('load/read_snapshot'):
+            frame = read_claims_snapshot(path)
+    elif LOAD_WORKERS > 1 and os.path.getsize(path) >= LOAD_PARALLEL_MIN_BYTES:
+        with stage('load/read_csv_parallel'):
+            frame = read_claims_csv_parallel(path)
+    else:
+        with stage('load/read_csv'):
+            frame = read_claims_csv(path)
+    load_seconds = time.perf_counter() - start
+    _dataset_version += 1
+    return ClaimsDataset(frame, path, signature, _dataset_version, load_seconds)
+
+
+# Return the shared dataset, loading it on first use or when the file has changed
+def get_claims_dataset(path=CLAIMS_CSV, reload=False):
+    global _dataset
+    path = resolve_claims_source(path)
+    signature = _file_signature(path)
+    if not reload and _is_current(_dataset, path, signature):
+        return _dataset
+
+    with _dataset_lock:
+        # Another session may have finished the load while we waited for the lock
+        if not reload and _is_current(_dataset, path, signature):
+            return _dataset
+        dataset = _load_dataset(path, signature)
+        _run_load_hooks(dataset)
+        _dataset = dataset
+        return _dataset
+
+
+# Replace the shared dataset with an upserted copy. upsert(dataset) runs under the
+# load lock and returns (frame, delta), or None when there is nothing to apply.
+def update_claims_dataset(upsert):
+    global _dataset, _dataset_version
+    with _dataset_lock:
+        if _dataset is None:
+            return None
+        start = time.perf_counter()
+        result = upsert(_dataset)
+        if result is None:
+            return _dataset
+        frame, delta = result
+        _dataset_version += 1
+        dataset = _dataset.updated(frame, delta, _dataset_version)
+        _run_load_hooks(dataset)
+        dataset.load_seconds = time.perf_counter() - start
+        _dataset = dataset
+        return _dataset
+
+
+# Explicit reload hook, e.g. after the extract was replaced in place with the same size
+def reload_claims_dataset(path=CLAIMS_CSV):
+    return get_claims_dataset(path, reload=True)
+
+
+# Currently loaded dataset, or None if nothing has been loaded yet
+def current_claims_dataset():
+    return _dataset
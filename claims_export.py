@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import hmac
+import os
+import secrets
+import tempfile
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Rows fetched from the source per write; bounds the memory of one export
+EXPORT_CHUNK_ROWS = 50_000
+
+# Exports running at once across all sessions; further requests wait for a slot
+EXPORT_WORKERS = int(os.environ.get("CLAIMS_EXPORT_WORKERS", "2"))
+
+EXPORT_FORMATS = {
+    'CSV': {'extension': '.csv', 'mime': 'text/csv'},
+    'Parquet': {'extension': '.parquet', 'mime': 'application/vnd.apache.parquet'},
+}
+
+# Export links stay valid this long, and at most this many are kept
+EXPORT_LINK_SECONDS = 30 * 60
+EXPORT_LINKS_MAX = 256
+
+_export_slots = threading.BoundedSemaphore(EXPORT_WORKERS)
+
+
+# Writers take an iterable of DataFrames with the same columns, at least one of
+# them (possibly empty) so the header or schema is always written
+def write_csv(chunks, sink, compress=False):
+    out = gzip.GzipFile(fileobj=sink, mode='wb') if compress else sink
+    for i, chunk in enumerate(chunks):
+        out.write(chunk.to_csv(index=False, header=i == 0).encode())
+    if compress:
+        out.close()
+
+
+# Parquet has its own codecs, so "compress" switches the column chunks to gzip.
+# Each chunk becomes a row group written against the schema of the first one.
+def write_parquet(chunks, sink, compress=False):
+    writer = None
+    for chunk in chunks:
+        if writer is None:
+            schema = pa.Schema.from_pandas(chunk, preserve_index=False)
+            # An all-empty text column in the first chunk is inferred as null
+            for i, field in enumerate(schema):
+                if pa.types.is_null(field.type):
+                    schema = schema.set(i, field.with_type(pa.string()))
+            writer = pq.ParquetWriter(sink, schema, compression='gzip' if compress else 'snappy')
+        writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    writer.close()
+
+
+def export_file_name(base, fmt, compress=False):
+    name = base + EXPORT_FORMATS[fmt]['extension']
+    return name + ".gz" if compress and fmt == 'CSV' else name
+
+
+def export_mime(fmt, compress=False):
+    return 'application/gzip' if compress and fmt == 'CSV' else EXPORT_FORMATS[fmt]['mime']
+
+
+# Write a claims view (see claims_sources) to a temporary file chunk by chunk and
+# return its path; the caller removes the file
+def write_export_file(view, fmt='CSV', compress=False, chunk_rows=EXPORT_CHUNK_ROWS):
+    write = write_parquet if fmt == 'Parquet' else write_csv
+    with _export_slots:
+        with tempfile.NamedTemporaryFile(suffix=EXPORT_FORMATS[fmt]['extension'], delete=False) as sink:
+            path = sink.name
+            try:
+                write(view.chunks(chunk_rows), sink, compress)
+            except Exception:
+                sink.close()
+                os.unlink(path)
+                raise
+    return path
+
+
+# The whole export as bytes, for st.download_button when the export server is
+# not running. Streamlit keeps the download in memory, so this costs the full
+# size of the file; export links (below) stream it instead.
+def export_bytes(view, fmt='CSV', compress=False):
+    path = write_export_file(view, fmt, compress)
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    finally:
+        os.unlink(path)
+
+
+# A view registered for download: the file is written when the link is fetched
+ExportLink = namedtuple('ExportLink', ['view', 'fmt', 'compress', 'file_name', 'expires'])
+
+
+# Download links served by the claims API (see claims_api), which writes the
+# export to a temporary file and streams it to the browser. Tokens are derived
+# from a key naming the view with a per-process secret, so reruns showing the
+# same view reuse one link. Links expire, and the oldest are dropped beyond max_links.
+class ExportLinks:
+    def __init__(self, max_links=EXPORT_LINKS_MAX, ttl_seconds=EXPORT_LINK_SECONDS):
+        self.max_links = max_links
+        self.ttl_seconds = ttl_seconds
+        self._secret = secrets.token_bytes(16)
+        self._links = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, key, view, fmt, compress, file_name):
+        token = hmac.new(self._secret, repr(key).encode(), hashlib.sha256).hexdigest()[:32]
+        with self._lock:
+            self._links.pop(token, None)
+            self._links[token] = ExportLink(view, fmt, compress, file_name, time.monotonic() + self.ttl_seconds)
+            while len(self._links) > self.max_links:
+                self._links.popitem(last=False)
+        return token
+
+    def get(self, token):
+        with self._lock:
+            link = self._links.get(token)
+            if link is not None and link.expires < time.monotonic():
+                del self._links[token]
+                return None
+            return link
+
+
+export_links = ExportLinks()
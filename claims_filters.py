@@ -0,0 +1,460 @@
+import hashlib
+import json
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from claims_cache import LruCache
+from claims_data import FILTER_DATE_COLUMNS, TEXT_FILTER_COLUMNS, delta_positions, register_delta_update
+
+# A constraint matching at most 1/SPARSE_RATIO of the rows seeds the selection
+# directly from its row positions instead of intersecting full-length bitsets
+SPARSE_RATIO = 64
+
+# Memory for the sort ranks and sorted row orders shared between sessions; the
+# least recently used are dropped and recomputed when needed again
+SORT_CACHE_BYTES = int(os.environ.get('CLAIMS_SORT_CACHE_MB', '256')) * 1024 * 1024
+
+_NAT = np.iinfo(np.int64).min
+_NO_BITS = np.zeros(0, dtype=np.uint8)
+
+# Set bits in each byte value
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+# One filter in a form the engine can evaluate: an estimated row count, either a
+# bitset or row positions of the matching rows, and matches(positions), which
+# tests the given rows against the filter
+Constraint = namedtuple('Constraint', ['size', 'bits', 'positions', 'matches'])
+
+
+# Normalised sidebar filter state. Text filters that include "All" are dropped,
+# and date ranges are inclusive (start, end) Timestamps.
+class FilterState:
+    def __init__(self, claim_numbers=(), text_filters=None, date_ranges=None):
+        self.claim_numbers = tuple(claim_numbers)
+        self.text_filters = {
+            col: tuple(values)
+            for col, values in (text_filters or {}).items()
+            if "All" not in values
+        }
+        self.date_ranges = {
+            col: (pd.Timestamp(start), pd.Timestamp(end))
+            for col, (start, end) in (date_ranges or {}).items()
+        }
+
+    # Filter steps in sidebar order as (name, params); inactive steps have params None
+    def steps(self):
+        return (
+            [('claim_number', self.claim_numbers or None)]
+            + [(col, self.text_filters.get(col)) for col in TEXT_FILTER_COLUMNS]
+            + [(col, self.date_ranges.get(col)) for col in FILTER_DATE_COLUMNS]
+        )
+
+    # JSON-compatible form of the state: the same filters give the same value
+    # regardless of selection order, duplicates or widget order
+    def canonical(self):
+        return {
+            'claim_numbers': sorted(set(self.claim_numbers)),
+            'text_filters': {col: sorted(set(map(str, values))) for col, values in self.text_filters.items()},
+            'date_ranges': {
+                col: [start.isoformat(), end.isoformat()] for col, (start, end) in self.date_ranges.items()
+            },
+        }
+
+    # Hash of the canonical form
+    def key(self):
+        return hashlib.sha1(json.dumps(self.canonical(), sort_keys=True).encode()).hexdigest()
+
+
+def _to_seconds(value):
+    return np.datetime64(pd.Timestamp(value), 's').astype(np.int64)
+
+
+def _pack(mask):
+    return np.packbits(mask, bitorder='little')
+
+
+def _unpack(bits, n_rows):
+    return np.unpackbits(bits, count=n_rows, bitorder='little').view(bool)
+
+
+# Set bits in a bitset, with numpy's native popcount where available (numpy 2)
+def _bit_count(bits):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bits).sum(dtype=np.int64))
+    return int(_POPCOUNT[bits].sum(dtype=np.int64))
+
+
+def _bit_test(bits, positions):
+    return ((bits[positions >> 3] >> (positions & 7).astype(np.uint8)) & 1).view(bool)
+
+
+# Copy of a bitset sized for n_rows with the bits at positions set to flags
+def _with_bits(bits, n_rows, positions, flags):
+    updated = np.zeros((n_rows + 7) // 8, dtype=np.uint8)
+    updated[:min(len(bits), len(updated))] = bits[:len(updated)]
+    masks = np.left_shift(1, positions & 7).astype(np.uint8)
+    np.bitwise_and.at(updated, positions >> 3, ~masks)
+    np.bitwise_or.at(updated, positions[flags] >> 3, masks[flags])
+    return updated
+
+
+# claim_number -> row positions for one dataset version: the claim numbers in
+# sorted order with their row positions. Exact numbers and prefixes are answered
+# with binary searches, so a lookup costs time in the number of claims asked for.
+class ClaimNumberIndex:
+    def __init__(self, claim_numbers):
+        positions = np.flatnonzero(claim_numbers.notna().to_numpy())
+        keys = claim_numbers.iloc[positions]
+        order = keys.argsort(kind='stable').to_numpy()
+        self._sorted_keys = keys.to_numpy(dtype=object)[order]
+        self._sorted_positions = positions[order]
+
+    def __len__(self):
+        return len(self._sorted_keys)
+
+    # For each claim number that is present: its index in claim_numbers and the row
+    # position holding it, once per row when a number is duplicated
+    def lookup(self, claim_numbers):
+        numbers = np.array(list(claim_numbers), dtype=object)
+        lo = np.searchsorted(self._sorted_keys, numbers, side='left')
+        hi = np.searchsorted(self._sorted_keys, numbers, side='right')
+        runs = hi - lo
+        which = np.repeat(np.arange(len(numbers)), runs)
+        offsets = np.arange(runs.sum()) - np.repeat(np.cumsum(runs) - runs, runs)
+        return which, self._sorted_positions[np.repeat(lo, runs) + offsets]
+
+    # Row positions of the given claim numbers; unknown numbers are ignored
+    def positions(self, claim_numbers):
+        return self.lookup(claim_numbers)[1]
+
+    # Index with new, previously absent claim numbers at the given row positions
+    # merged in, without re-sorting the existing numbers
+    def extended(self, claim_numbers, positions):
+        present = claim_numbers.notna().to_numpy()
+        keys = claim_numbers[present].to_numpy(dtype=object)
+        order = np.argsort(keys, kind='stable')
+        keys, positions = keys[order], np.asarray(positions)[present][order]
+        at = np.searchsorted(self._sorted_keys, keys, side='right')
+        index = ClaimNumberIndex.__new__(ClaimNumberIndex)
+        index._sorted_keys = np.insert(self._sorted_keys, at, keys)
+        index._sorted_positions = np.insert(self._sorted_positions, at, positions)
+        return index
+
+    # Row positions of every claim number starting with the prefix
+    def prefix_positions(self, prefix):
+        lo = np.searchsorted(self._sorted_keys, prefix, side='left')
+        hi = np.searchsorted(self._sorted_keys, prefix + '\U0010ffff', side='right')
+        return self._sorted_positions[lo:hi]
+
+    # Sorted, de-duplicated row positions for sidebar input, where a trailing "*"
+    # turns a partially typed number into a prefix search
+    def find(self, claim_numbers):
+        exact = [number for number in claim_numbers if not number.endswith('*')]
+        matches = [self.positions(exact)]
+        for number in claim_numbers:
+            if number.endswith('*'):
+                matches.append(self.prefix_positions(number[:-1]))
+        return np.unique(np.concatenate(matches))
+
+
+# Filter indexes for one dataset version: a bitset per value of every text filter
+# column and the row positions of every date filter column sorted by date.
+# select() intersects any combination of filters without building DataFrames.
+class ClaimsFilterEngine:
+    def __init__(self, frame, text_columns=TEXT_FILTER_COLUMNS, date_columns=FILTER_DATE_COLUMNS):
+        self.n_rows = len(frame)
+        self.claim_index = ClaimNumberIndex(
+            frame['claim_number'] if 'claim_number' in frame.columns else pd.Series([], dtype=str)
+        )
+
+        self._value_bits = {}
+        self._value_counts = {}
+        for col in text_columns:
+            if col not in frame.columns:
+                continue
+            values = frame[col].astype('category')
+            codes = values.cat.codes.to_numpy()
+            counts = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+            self._value_bits[col] = {
+                value: _pack(codes == code) for code, value in enumerate(values.cat.categories)
+            }
+            self._value_counts[col] = dict(zip(values.cat.categories, counts.tolist()))
+
+        self._date_values = {}
+        self._date_order = {}
+        self._date_sorted = {}
+        self._date_not_null = {}
+        for col in date_columns:
+            if col not in frame.columns:
+                continue
+            values = frame[col].to_numpy('datetime64[s]').view(np.int64)
+            valid = np.flatnonzero(values != _NAT)
+            order = valid[np.argsort(values[valid], kind='stable')]
+            self._date_values[col] = values
+            self._date_order[col] = order
+            self._date_sorted[col] = values[order]
+            self._date_not_null[col] = _pack(values != _NAT)
+
+    # Indexes for the upserted frame, patched at the overwritten and appended rows
+    # instead of rebuilt. Overwritten rows keep their claim number.
+    def updated(self, frame, delta):
+        touched = delta_positions(delta, len(frame))
+        engine = ClaimsFilterEngine.__new__(ClaimsFilterEngine)
+        engine.n_rows = len(frame)
+        engine.claim_index = self.claim_index.extended(
+            frame['claim_number'].iloc[delta.n_old:], np.arange(delta.n_old, len(frame))
+        )
+
+        engine._value_bits = {}
+        engine._value_counts = {}
+        for col, value_bits in self._value_bits.items():
+            old_values = delta.old_rows[col].dropna()
+            new_values = frame[col].take(touched)
+            counts = dict(self._value_counts[col])
+            for value, count in old_values.value_counts().items():
+                counts[value] = counts.get(value, 0) - count
+            for value, count in new_values.value_counts().items():
+                counts[value] = counts.get(value, 0) + count
+            new_values = new_values.to_numpy(dtype=object)
+            changed = set(old_values) | set(new_values[pd.notna(new_values)])
+            engine._value_bits[col] = {
+                value: (
+                    _with_bits(value_bits.get(value, _NO_BITS), engine.n_rows, touched, new_values == value)
+                    if value in changed or engine.n_rows != self.n_rows else value_bits[value]
+                )
+                for value in counts
+            }
+            engine._value_counts[col] = counts
+
+        engine._date_values = {}
+        engine._date_order = {}
+        engine._date_sorted = {}
+        engine._date_not_null = {}
+        overwritten = np.zeros(self.n_rows, dtype=bool)
+        overwritten[delta.changed] = True
+        for col in self._date_values:
+            values = frame[col].to_numpy('datetime64[s]').view(np.int64)
+            keep = ~overwritten[self._date_order[col]]
+            order, sorted_values = self._date_order[col][keep], self._date_sorted[col][keep]
+            added = touched[values[touched] != _NAT]
+            added = added[np.argsort(values[added], kind='stable')]
+            at = np.searchsorted(sorted_values, values[added], side='right')
+            engine._date_values[col] = values
+            engine._date_order[col] = np.insert(order, at, added)
+            engine._date_sorted[col] = np.insert(sorted_values, at, values[added])
+            engine._date_not_null[col] = _with_bits(
+                self._date_not_null[col], engine.n_rows, touched, values[touched] != _NAT
+            )
+        return engine
+
+    # Union of the bitsets of the selected values; unknown values match nothing
+    def value_bits(self, col, values):
+        bits = np.zeros((self.n_rows + 7) // 8, dtype=np.uint8)
+        for value in values:
+            value_bits = self._value_bits[col].get(value)
+            if value_bits is not None:
+                bits |= value_bits
+        return bits
+
+    # Row positions whose date lies in [start, end], in date order
+    def date_positions(self, col, start, end):
+        sorted_values = self._date_sorted[col]
+        lo = np.searchsorted(sorted_values, _to_seconds(start), side='left')
+        hi = np.searchsorted(sorted_values, _to_seconds(end), side='right')
+        return self._date_order[col][lo:hi]
+
+    # Build the Constraint for one filter step; params of None means the step is inactive
+    def constraint(self, name, params):
+        if name == 'claim_number':
+            positions = self.claim_index.find(params)
+            return Constraint(len(positions), None, positions, lambda pos: np.isin(pos, positions))
+
+        if name in self._value_bits:
+            bits = self.value_bits(name, params)
+            size = sum(self._value_counts[name].get(value, 0) for value in params)
+            return Constraint(size, bits, None, lambda pos: _bit_test(bits, pos))
+
+        start, end = params
+        lo, hi = _to_seconds(start), _to_seconds(end)
+        sorted_values = self._date_sorted[name]
+        if len(sorted_values) and lo <= sorted_values[0] and hi >= sorted_values[-1]:
+            # The range spans every date in the column, so it only excludes missing dates
+            bits = self._date_not_null[name]
+            return Constraint(len(sorted_values), bits, None, lambda pos: _bit_test(bits, pos))
+        positions = self.date_positions(name, start, end)
+        values = self._date_values[name]
+        return Constraint(len(positions), None, positions, lambda pos: (values[pos] >= lo) & (values[pos] <= hi))
+
+    # Sorted positions of the rows matching a constraint, out of rows (all rows if None)
+    def apply(self, constraint, rows=None):
+        if rows is not None:
+            return rows[constraint.matches(rows)]
+        if constraint.positions is not None:
+            return np.sort(constraint.positions)
+        return np.flatnonzero(_unpack(constraint.bits, self.n_rows))
+
+    def _constraints(self, state):
+        return [self.constraint(name, params) for name, params in state.steps() if params is not None]
+
+    # Sorted row positions matching every filter in the state
+    def select(self, state):
+        constraints = sorted(self._constraints(state), key=lambda constraint: constraint.size)
+        if not constraints:
+            return np.arange(self.n_rows)
+
+        if constraints[0].size * SPARSE_RATIO <= self.n_rows:
+            # Sparse: start from the smallest filter and test only its rows
+            positions = self.apply(constraints[0])
+            for constraint in constraints[1:]:
+                if not len(positions):
+                    break
+                positions = self.apply(constraint, positions)
+            return positions
+
+        # Dense: intersect bitsets, scattering positional filters into bitsets first
+        selected = None
+        for constraint in constraints:
+            bits = constraint.bits
+            if bits is None:
+                mask = np.zeros(self.n_rows, dtype=bool)
+                mask[constraint.positions] = True
+                bits = _pack(mask)
+            selected = bits.copy() if selected is None else np.bitwise_and(selected, bits, out=selected)
+        return np.flatnonzero(_unpack(selected, self.n_rows))
+
+
+    # Faceted option counts: for each text filter column, {value: rows} over the
+    # rows matching every active filter except that column's own, so an option
+    # shows what selecting it would give. The claim number and date filters are
+    # selected once; the other text filters are combined with prefix and suffix
+    # ANDs of their bitsets, and each value is counted by ANDing its own bitset.
+    def facet_counts(self, state):
+        base = self.select(FilterState(state.claim_numbers, None, state.date_ranges))
+        base_mask = np.zeros(self.n_rows, dtype=bool)
+        base_mask[base] = True
+        base_bits = _pack(base_mask)
+
+        columns = list(self._value_bits)
+        matches = [
+            self.value_bits(col, state.text_filters[col]) if col in state.text_filters else None
+            for col in columns
+        ]
+        active = [i for i, match in enumerate(matches) if match is not None]
+        prefix, suffix = [base_bits], [None]
+        for i in active:
+            prefix.append(prefix[-1] & matches[i])
+        for i in reversed(active):
+            suffix.insert(0, matches[i] if suffix[0] is None else suffix[0] & matches[i])
+
+        counts = {}
+        for i, col in enumerate(columns):
+            if i in active:
+                at = active.index(i)
+                mask = prefix[at] if suffix[at + 1] is None else prefix[at] & suffix[at + 1]
+            else:
+                mask = prefix[-1]
+            counts[col] = {value: _bit_count(bits & mask) for value, bits in self._value_bits[col].items()}
+        return counts
+
+
+# Whether new params for a filter step can only remove rows that old params kept
+def _narrows(name, old, new):
+    if new is None:
+        return old is None
+    if old is None:
+        return True
+    if name in FILTER_DATE_COLUMNS:
+        return old[0] <= new[0] and new[1] <= old[1]
+    return set(new) <= set(old)
+
+
+# Per-session chain of intermediate selections, one per filter step in sidebar
+# order. When a filter changes, only that step and the ones after it are
+# re-evaluated, starting from the cached selection before it; a narrowed filter
+# instead refines the rows its own step kept last time. Steps that remove no
+# rows share their input array, so the default view holds a single selection.
+class IncrementalSelection:
+    def __init__(self, engine):
+        self.engine = engine
+        self._steps = []
+
+    def select(self, state):
+        steps = state.steps()
+        changed = 0
+        while changed < len(self._steps) and self._steps[changed][:2] == steps[changed]:
+            changed += 1
+        if changed == len(steps):
+            rows = self._steps[-1][2]
+            return rows if rows is not None else np.arange(self.engine.n_rows)
+
+        rows = self._steps[changed - 1][2] if changed else None
+        if changed < len(self._steps):
+            name, old_params, old_rows = self._steps[changed]
+            if old_params is not None and _narrows(name, old_params, steps[changed][1]):
+                rows = old_rows
+
+        chain = self._steps[:changed]
+        for name, params in steps[changed:]:
+            if params is not None:
+                selected = self.engine.apply(self.engine.constraint(name, params), rows)
+                rows = rows if rows is not None and len(selected) == len(rows) else selected
+            chain.append((name, params, rows))
+        self._steps = chain
+        return rows if rows is not None else np.arange(self.engine.n_rows)
+
+
+# Lazy view of the selected rows of a dataset. Columns are gathered on demand for
+# just the rows asked for, so the filtered frame is never materialised as a whole.
+class ClaimsSelection:
+    def __init__(self, dataset, rows):
+        self.dataset = dataset
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def column(self, col):
+        return self.dataset.frame[col].take(self.rows)
+
+    def nunique(self, col):
+        return self.column(col).nunique()
+
+    # Selected rows [start, stop) as a DataFrame, optionally limited to some columns
+    def frame(self, columns=None, start=0, stop=None):
+        frame = self.dataset.frame if columns is None else self.dataset.frame[columns]
+        return frame.take(self.rows[start:stop])
+
+    # The same rows ordered by a column, missing values last; ties keep row order
+    def sorted(self, col, ascending=True):
+        rank = get_sort_rank(self.dataset, col)[self.rows]
+        if not ascending:
+            rank = np.where(rank >= 0, rank.max(initial=0) - rank, rank)
+        rank = np.where(rank >= 0, rank, np.iinfo(rank.dtype).max)
+        return ClaimsSelection(self.dataset, self.rows[np.argsort(rank, kind='stable')])
+
+
+# Sort ranks and sorted row orders, bounded by the bytes of the arrays
+sort_cache = LruCache(max_bytes=SORT_CACHE_BYTES, size=lambda values: values.nbytes)
+
+
+# Dense rank of every row by a column (-1 for missing values), kept per dataset
+# version and column in the sort cache so sorting a selection is an integer argsort
+def get_sort_rank(dataset, col):
+    def build():
+        rank = dataset.frame[col].rank(method='dense', na_option='keep')
+        dtype = np.int32 if len(rank) < np.iinfo(np.int32).max else np.int64
+        return rank.fillna(0).to_numpy(dtype=dtype) - 1
+
+    return sort_cache.get_or_compute(('sort_rank', dataset.version, col), build)
+
+
+# Filter engine shared by all sessions viewing this dataset version
+def get_filter_engine(dataset):
+    return dataset.derived('filter_engine', lambda d: ClaimsFilterEngine(d.frame))
+
+
+register_delta_update('filter_engine', lambda engine, dataset, delta: engine.updated(dataset.frame, delta))
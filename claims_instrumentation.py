@@ -0,0 +1,290 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Opt-in: with CLAIMS_INSTRUMENT=1 each render stage records wall time, CPU time
+# and allocations. Allocations come from tracemalloc, which slows every Python
+# allocation while it runs, so this is for diagnosis rather than production.
+INSTRUMENT = os.environ.get('CLAIMS_INSTRUMENT', '0') == '1'
+
+# Prometheus metrics are served on 127.0.0.1 at this port (0 disables the endpoint)
+METRICS_PORT = int(os.environ.get('CLAIMS_METRICS_PORT', '9464'))
+
+# One JSON object per rerun is logged here, or to stderr when unset
+INSTRUMENT_LOG = os.environ.get('CLAIMS_INSTRUMENT_LOG')
+
+# Upper bounds, in seconds, of the stage duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Totals for one stage: times entered, wall and CPU seconds, and allocated bytes
+# (the peak traced memory above the level at entry)
+StageTiming = namedtuple('StageTiming', ['calls', 'wall_seconds', 'cpu_seconds', 'allocated_bytes'])
+_NO_TIMING = StageTiming(0, 0.0, 0.0, 0)
+
+
+def _added(timing, other):
+    return StageTiming(*(a + b for a, b in zip(timing, other)))
+
+
+def _timing_json(timing):
+    return {
+        'calls': timing.calls,
+        'wall_ms': round(timing.wall_seconds * 1000, 3),
+        'cpu_ms': round(timing.cpu_seconds * 1000, 3),
+        'allocated_bytes': timing.allocated_bytes,
+    }
+
+
+# Process-wide stage metrics in Prometheus form: a duration histogram plus CPU
+# and allocation counters per stage, and a rerun counter
+class StageRegistry:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._timings = {}
+        self._bucket_counts = {}
+        self.reruns = 0
+
+    def observe(self, name, timing):
+        with self._lock:
+            self._timings[name] = _added(self._timings.get(name, _NO_TIMING), timing)
+            counts = self._bucket_counts.setdefault(name, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if timing.wall_seconds <= bound:
+                    counts[i] += 1
+
+    def count_rerun(self):
+        with self._lock:
+            self.reruns += 1
+
+    # Text exposition format served at /metrics
+    def exposition(self):
+        with self._lock:
+            timings = dict(self._timings)
+            bucket_counts = {name: list(counts) for name, counts in self._bucket_counts.items()}
+            reruns = self.reruns
+        lines = [
+            "# HELP claims_stage_seconds Wall time of dashboard render stages.",
+            "# TYPE claims_stage_seconds histogram",
+        ]
+        for name, timing in sorted(timings.items()):
+            for bound, count in zip(self.buckets, bucket_counts[name]):
+                lines.append(f'claims_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+            lines.append(f'claims_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {timing.calls}')
+            lines.append(f'claims_stage_seconds_sum{{stage="{name}"}} {timing.wall_seconds}')
+            lines.append(f'claims_stage_seconds_count{{stage="{name}"}} {timing.calls}')
+        lines += [
+            "# HELP claims_stage_cpu_seconds_total CPU time of dashboard render stages.",
+            "# TYPE claims_stage_cpu_seconds_total counter",
+        ]
+        lines += [
+            f'claims_stage_cpu_seconds_total{{stage="{name}"}} {timing.cpu_seconds}'
+            for name, timing in sorted(timings.items())
+        ]
+        lines += [
+            "# HELP claims_stage_allocated_bytes_total Bytes allocated by dashboard render stages.",
+            "# TYPE claims_stage_allocated_bytes_total counter",
+        ]
+        lines += [
+            f'claims_stage_allocated_bytes_total{{stage="{name}"}} {timing.allocated_bytes}'
+            for name, timing in sorted(timings.items())
+        ]
+        lines += [
+            "# HELP claims_reruns_total Dashboard reruns.",
+            "# TYPE claims_reruns_total counter",
+            f"claims_reruns_total {reruns}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+registry = StageRegistry()
+
+# Per thread: the stack of open stages and the rerun being recorded, if any
+_local = threading.local()
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        _local.stack = []
+    return _local.stack
+
+
+# One entered stage. Nested stages reset the tracemalloc peak, so the peak seen so
+# far is folded into the enclosing stage first and handed back on exit. Traced
+# memory is process-wide, so allocations overlap when sessions rerun concurrently.
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        stack = _stack()
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self.start_memory = self.peak = tracemalloc.get_traced_memory()[0]
+        self.start_cpu = time.thread_time()
+        self.start_wall = time.perf_counter()
+        stack.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.thread_time() - self.start_cpu
+        peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+        stack = _stack()
+        stack.pop()
+        if stack:
+            stack[-1].peak = max(stack[-1].peak, peak)
+
+        timing = StageTiming(1, wall, cpu, max(peak - self.start_memory, 0))
+        registry.observe(self.name, timing)
+        record = getattr(_local, 'rerun', None)
+        if record is not None:
+            record.add(self.name, timing)
+        elif not stack:
+            # Work outside a rerun, such as an export generated on download
+            _log({'event': 'stage', 'stage': self.name, **_timing_json(timing)})
+        return False
+
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+# Context manager timing one named stage; does nothing unless instrumentation is on
+def stage(name):
+    if not INSTRUMENT:
+        return _NO_STAGE
+    start_instrumentation()
+    return _Stage(name)
+
+
+# Stage totals of one rerun of one session
+class RerunRecord:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.started = datetime.now(timezone.utc)
+        self.stages = {}
+
+    def add(self, name, timing):
+        self.stages[name] = _added(self.stages.get(name, _NO_TIMING), timing)
+
+    def to_json(self):
+        return {
+            'event': 'rerun',
+            'session': self.session_id,
+            'started': self.started.isoformat(),
+            'stages': {name: _timing_json(timing) for name, timing in self.stages.items()},
+        }
+
+
+# What a session keeps between reruns: the last complete rerun and per-stage totals
+SessionInstrumentation = namedtuple('SessionInstrumentation', ['session_id', 'reruns', 'last', 'totals'])
+
+_logger = logging.getLogger('claims_instrumentation')
+_started = False
+_start_lock = threading.Lock()
+
+
+def _log(entry):
+    _logger.info(json.dumps(entry))
+
+
+def _serve_metrics(port):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.exposition().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='claims-metrics', daemon=True).start()
+    return server
+
+
+# Start tracing allocations, the JSON log and the metrics endpoint, once per process
+def start_instrumentation():
+    global _started
+    if _started:
+        return
+    with _start_lock:
+        if _started:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        handler = logging.FileHandler(INSTRUMENT_LOG) if INSTRUMENT_LOG else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _logger.addHandler(handler)
+        _logger.setLevel(logging.INFO)
+        _logger.propagate = False
+        if METRICS_PORT:
+            try:
+                _serve_metrics(METRICS_PORT)
+            except OSError as e:
+                print(f"Metrics endpoint not started on port {METRICS_PORT}: {e}")
+        _started = True
+
+
+# Record one rerun of a session. session is a dict-like kept per user session
+# (st.session_state); it receives a SessionInstrumentation once the rerun ends,
+# including when the script is stopped early (st.rerun raises to do so).
+@contextmanager
+def instrumented_rerun(session):
+    if not INSTRUMENT:
+        yield None
+        return
+
+    start_instrumentation()
+    previous = session.get('instrumentation')
+    record = RerunRecord(previous.session_id if previous else uuid.uuid4().hex)
+    _local.rerun = record
+    try:
+        with _Stage('rerun'):
+            yield record
+    finally:
+        _local.rerun = None
+        registry.count_rerun()
+        _log(record.to_json())
+        totals = dict(previous.totals) if previous else {}
+        for name, timing in record.stages.items():
+            totals[name] = _added(totals.get(name, _NO_TIMING), timing)
+        reruns = previous.reruns + 1 if previous else 1
+        session['instrumentation'] = SessionInstrumentation(record.session_id, reruns, record, totals)
+
+
+# Rows for a table of stage timings: stage, calls, wall ms, CPU ms, allocated MB
+def timing_rows(stages):
+    return [
+        {
+            'stage': name,
+            'calls': timing.calls,
+            'wall ms': round(timing.wall_seconds * 1000, 1),
+            'cpu ms': round(timing.cpu_seconds * 1000, 1),
+            'alloc MB': round(timing.allocated_bytes / 1024 ** 2, 2),
+        }
+        for name, timing in stages.items()
+    ]
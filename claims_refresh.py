@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from claims_data import ClaimsDelta, apply_claims_schema, update_claims_dataset
+from claims_filters import get_filter_engine
+
+# Rows per read_csv chunk when scanning a delta file
+DELTA_CHUNK_ROWS = 100_000
+
+
+# update_date is kept at day precision, so rows stamped on the high-water mark's
+# day are read again; rows identical to the loaded ones are skipped by the upsert
+def _is_new(update_dates, since):
+    if pd.isna(since):
+        return pd.Series(True, index=update_dates.index)
+    return pd.to_datetime(update_dates, errors='coerce').dt.normalize() >= since
+
+
+# Rows of a delta extract (same columns as Claims.csv) changed since the mark,
+# scanned in chunks so only those rows are held in memory
+def read_delta_csv(path, since):
+    chunks = [
+        chunk[_is_new(chunk['update_date'], since)]
+        for chunk in pd.read_csv(path, dtype={'claim_number': str}, chunksize=DELTA_CHUNK_ROWS)
+    ]
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+
+# Per pair of rows, whether every column holds the same value (missing == missing)
+def _rows_equal(left, right):
+    equal = np.ones(len(left), dtype=bool)
+    for col in left.columns:
+        x, y = left[col], right[col]
+        x_missing, y_missing = x.isna().to_numpy(), y.isna().to_numpy()
+        same = x_missing & y_missing
+        both = ~x_missing & ~y_missing
+        same[both] = x.to_numpy(dtype=object)[both] == y.to_numpy(dtype=object)[both]
+        equal &= same
+    return equal
+
+
+# The column with the overwritten rows replaced and the appended rows added.
+# Categoricals keep their categories in order and gain any new values at the end.
+def _upserted_column(base, new, positions, which, appended):
+    if isinstance(base.dtype, pd.CategoricalDtype):
+        extra = pd.Index(new.dropna().astype(object).unique()).difference(base.cat.categories)
+        dtype = pd.CategoricalDtype(base.cat.categories.append(extra)) if len(extra) else base.dtype
+    elif base.dtype == new.dtype:
+        dtype = base.dtype
+    elif isinstance(base.dtype, np.dtype) and isinstance(new.dtype, np.dtype):
+        dtype = np.result_type(base.dtype, new.dtype)
+    else:
+        dtype = object
+    values = base.astype(dtype)
+    if len(positions):
+        values.iloc[positions] = new.iloc[which].astype(dtype).array
+    return pd.concat([values, new.iloc[appended].astype(dtype)], ignore_index=True)
+
+
+# Upsert changed rows into a dataset by claim_number: rows of known claims are
+# overwritten in place (every copy, if a claim number is duplicated) and new
+# claims appended. The latest update_date wins when a claim appears twice in the
+# delta. Returns (frame, ClaimsDelta), or None when nothing actually changed.
+def upsert_claims(dataset, delta):
+    frame = dataset.frame
+    delta = apply_claims_schema(delta.reindex(columns=frame.columns))
+    delta = (
+        delta[delta['claim_number'].notna()]
+        .sort_values('update_date', kind='stable')
+        .drop_duplicates('claim_number', keep='last')
+        .reset_index(drop=True)
+    )
+    which, positions = get_filter_engine(dataset).claim_index.lookup(delta['claim_number'])
+    appended = np.setdiff1d(np.arange(len(delta)), which)
+    changed = ~_rows_equal(frame.take(positions), delta.take(which))
+    which, positions = which[changed], positions[changed]
+    if not len(positions) and not len(appended):
+        return None
+
+    order = np.argsort(positions)
+    which, positions = which[order], positions[order]
+    upserted = pd.DataFrame({
+        col: _upserted_column(frame[col], delta[col], positions, which, appended) for col in frame.columns
+    })
+    return upserted, ClaimsDelta(positions, len(frame), frame.take(positions))
+
+
+# Apply the rows read_delta(high_water_mark) returns to the shared dataset. The
+# filter indexes and pre-aggregates of the new version are patched, not rebuilt.
+# Returns the current dataset with the number of overwritten and appended rows.
+def refresh_claims_dataset(read_delta):
+    counts = {'changed': 0, 'added': 0}
+
+    def upsert(dataset):
+        result = upsert_claims(dataset, read_delta(dataset.high_water_mark))
+        if result is not None:
+            frame, delta = result
+            counts['changed'], counts['added'] = len(delta.changed), len(frame) - delta.n_old
+        return result
+
+    dataset = update_claims_dataset(upsert)
+    return dataset, counts['changed'], counts['added']
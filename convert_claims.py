@@ -0,0 +1,37 @@
+import argparse
+import time
+
+from claims_data import CLAIMS_CSV, INGEST_CHUNK_ROWS, snapshot_path_for, write_claims_snapshot
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Convert the claims CSV extract into a columnar Arrow snapshot')
+    parser.add_argument(
+        '--csv',
+        default=CLAIMS_CSV,
+        help=f'CSV extract to convert (default: {CLAIMS_CSV})'
+    )
+    parser.add_argument(
+        '--output',
+        default=None,
+        help='Snapshot file to write (default: the CSV path with an .arrow extension)'
+    )
+    parser.add_argument(
+        '--chunk-rows',
+        type=int,
+        default=INGEST_CHUNK_ROWS,
+        help=f'Rows parsed and written per chunk; bounds peak memory (default: {INGEST_CHUNK_ROWS})'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    output = args.output or snapshot_path_for(args.csv)
+
+    print(f"Converting {args.csv} to {output}...")
+    start_time = time.time()
+    rows = write_claims_snapshot(args.csv, output, args.chunk_rows, progress=lambda p: print(f"  {p}"))
+    print(f"Wrote {rows:,} rows in {time.time() - start_time:.2f}s")
+
+if __name__ == "__main__":
+    main()
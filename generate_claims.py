@@ -0,0 +1,157 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from claims_data import CLAIMS_CSV
+
+# Rows generated and written at a time
+GENERATE_CHUNK_ROWS = 500_000
+
+# Share of values blanked in each optional column. Sidebar date ranges drop rows
+# with a blank date, so this also sets how much of the file the default view shows.
+NULL_FRACTION = 0.02
+
+# Claims are received over this window
+RECEIVED_FROM = np.datetime64('2021-01-01')
+RECEIVED_DAYS = 3 * 365
+
+# Skewed value distributions of the columns the sidebar filters on
+CATEGORY_WEIGHTS = {
+    'source_system': {'Guidewire': 0.55, 'Portal': 0.30, 'Legacy': 0.15},
+    'general_nature_of_loss': {'Collision': 0.35, 'Glass': 0.22, 'Storm': 0.18, 'Theft': 0.15, 'Fire': 0.10},
+    'line_of_business': {'Motor': 0.50, 'Home': 0.30, 'Commercial': 0.15, 'Travel': 0.05},
+    'claim_status': {'Closed': 0.60, 'Open': 0.30, 'Reopened': 0.10},
+    'fault_rating': {'Not At Fault': 0.45, 'At Fault': 0.35, 'Unknown': 0.20},
+    'fault_categorisation': {'Single': 0.60, 'Multi': 0.40},
+}
+
+# Median incurred amount per line of business
+INCURRED_MEDIANS = {'Motor': 9_000, 'Home': 25_000, 'Commercial': 80_000, 'Travel': 2_500}
+
+# Columns that may be blank; opportunity_actioned is also blank without a leakage opportunity
+OPTIONAL_COLUMNS = [
+    'fault_categorisation', 'claim_loss_date', 'claim_finalised_date', 'original_verified_date_of_loss_time',
+    'last_verified_date_of_loss_time', 'potential_leakage_amount', 'incurred_amount',
+]
+
+
+def _choice(rng, weights, rows):
+    return pd.Categorical.from_codes(
+        rng.choice(len(weights), rows, p=list(weights.values())), list(weights)
+    )
+
+
+def _days(values):
+    return values.astype('timedelta64[D]')
+
+
+# Synthetic claims with the columns of the extract. Claim numbers start at
+# CLM{100000 + first}; the same seed, first and rows give the same claims.
+def generate_claims(rows, seed=0, first=0, null_fraction=NULL_FRACTION):
+    rng = np.random.default_rng([seed, first])
+    frame = pd.DataFrame({'claim_number': np.char.add('CLM', np.arange(100_000 + first, 100_000 + first + rows).astype(str))})
+    for col, weights in CATEGORY_WEIGHTS.items():
+        frame[col] = _choice(rng, weights, rows)
+
+    # Volumes grow over the window; losses are reported within a month, mostly within
+    # days. Open claims carry their expected finalisation date, as in the extract.
+    received = RECEIVED_FROM + _days(np.floor(RECEIVED_DAYS * np.sqrt(rng.random(rows))))
+    loss = received - _days(np.minimum(rng.geometric(0.15, rows) - 1, 29))
+    finalised = received + _days(np.ceil(rng.gamma(2.0, 45.0, rows)))
+
+    # Verified loss dates are usually the reported one and occasionally corrected later
+    corrected = rng.random(rows) < 0.1
+    last_verified = np.where(corrected, loss + _days(rng.integers(1, 15, rows)), loss)
+
+    # Some storm and fire losses fall in a catastrophe window; the extract fills
+    # both window dates with the received date for every other claim
+    catastrophe = frame['general_nature_of_loss'].isin(['Storm', 'Fire']).to_numpy() & (rng.random(rows) < 0.4)
+    cat_from = np.where(catastrophe, loss - _days(rng.integers(0, 5, rows)), received)
+    cat_to = np.where(catastrophe, cat_from + _days(rng.integers(3, 30, rows)), received)
+
+    # Open claims were last touched around receipt, the others around finalisation
+    open_claims = (frame['claim_status'] == 'Open').to_numpy()
+    last_event = np.where(open_claims, received, finalised)
+    update = np.minimum(last_event + _days(rng.integers(0, 30, rows)), RECEIVED_FROM + _days(np.array(RECEIVED_DAYS)))
+    frame['claim_received_date'] = received
+    frame['claim_loss_date'] = loss
+    frame['claim_finalised_date'] = finalised
+    frame['original_verified_date_of_loss_time'] = loss
+    frame['last_verified_date_of_loss_time'] = last_verified
+    frame['catastrophe_valid_from_date_time'] = cat_from
+    frame['catastrophe_valid_to_date_time'] = cat_to
+    frame['update_date'] = update
+
+    # Flags arrive as Y/N text; actioning is only recorded for leakage opportunities
+    leakage = rng.random(rows) < 0.35
+    actioned = rng.random(rows) < 0.45
+    frame['leakage_opportunity'] = np.where(leakage, 'Y', 'N')
+    frame['opportunity_actioned'] = np.where(leakage, np.where(actioned, 'Y', 'N'), None)
+
+    medians = frame['line_of_business'].map(INCURRED_MEDIANS).to_numpy(dtype=float)
+    incurred = np.round(medians * rng.lognormal(0.0, 0.9, rows), 2)
+    frame['potential_leakage_amount'] = np.round(incurred * rng.beta(2.0, 14.0, rows), 2)
+    frame['incurred_amount'] = incurred
+
+    for col in OPTIONAL_COLUMNS:
+        blank = rng.random(rows) < null_fraction
+        frame[col] = frame[col].mask(blank)
+    return frame
+
+
+# Write `rows` synthetic claims to a CSV in chunks of chunk_rows, dates as ISO text
+def write_claims_csv(path, rows, seed=0, chunk_rows=GENERATE_CHUNK_ROWS, null_fraction=NULL_FRACTION):
+    for first in range(0, rows, chunk_rows):
+        frame = generate_claims(min(chunk_rows, rows - first), seed, first, null_fraction)
+        frame.to_csv(path, mode='w' if first == 0 else 'a', header=first == 0, index=False, date_format='%Y-%m-%d')
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Generate a synthetic claims extract')
+    parser.add_argument(
+        '--rows',
+        type=int,
+        default=100_000,
+        help='Number of claims (default: 100000)'
+    )
+    parser.add_argument(
+        '--output',
+        default=CLAIMS_CSV,
+        help=f'CSV file to write (default: {CLAIMS_CSV})'
+    )
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=0,
+        help='Random seed; the same seed and size give the same file (default: 0)'
+    )
+    parser.add_argument(
+        '--null-fraction',
+        type=float,
+        default=NULL_FRACTION,
+        help=f'Share of values blanked in the optional columns (default: {NULL_FRACTION})'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Overwrite the output file if it exists'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if os.path.exists(args.output) and not args.force:
+        sys.exit(f"{args.output} already exists; pass --force to overwrite it")
+
+    print(f"Writing {args.rows:,} synthetic claims to {args.output}...")
+    start_time = time.time()
+    write_claims_csv(args.output, args.rows, args.seed, null_fraction=args.null_fraction)
+    size_mb = os.path.getsize(args.output) / 1024 ** 2
+    print(f"Wrote {size_mb:,.1f} MB in {time.time() - start_time:.2f}s")
+
+if __name__ == "__main__":
+    main()
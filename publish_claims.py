@@ -0,0 +1,67 @@
+import argparse
+import os
+import time
+
+from claims_data import CLAIMS_CSV, SHARED_DIR, SHARED_KEEP_VERSIONS, publish_shared_frame
+from claims_sources import DELTA_SOURCE, DatasetSource
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(
+        description='Load the claims once and publish them for every dashboard worker to memory-map'
+    )
+    parser.add_argument(
+        '--csv',
+        default=CLAIMS_CSV,
+        help=f'Claims extract to publish; its Arrow snapshot is used when newer (default: {CLAIMS_CSV})'
+    )
+    parser.add_argument(
+        '--dir',
+        default=SHARED_DIR or None,
+        help='Directory the workers read through CLAIMS_SHARED_DIR, e.g. /dev/shm/claims'
+    )
+    parser.add_argument(
+        '--keep',
+        type=int,
+        default=SHARED_KEEP_VERSIONS,
+        help=f'Published versions kept on disk (default: {SHARED_KEEP_VERSIONS})'
+    )
+    parser.add_argument(
+        '--delta-source',
+        default=DELTA_SOURCE,
+        help='Delta CSV or database URL of changed claims to apply before each publish (default: CLAIMS_DELTA_SOURCE)'
+    )
+    parser.add_argument(
+        '--watch',
+        type=float,
+        default=0,
+        help='Keep running and check for changes every this many seconds (default: publish once)'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if not args.dir:
+        raise SystemExit("Pass --dir or set CLAIMS_SHARED_DIR")
+
+    # Loaded in this process only; refreshes run before each check when watching
+    source = DatasetSource(args.csv, args.delta_source, args.watch, shared_dir='')
+    if args.delta_source and not args.watch:
+        source.refresh()
+    published = None
+    while True:
+        dataset = source.dataset
+        if dataset.version != published:
+            start_time = time.time()
+            path = publish_shared_frame(dataset.frame, args.dir, args.keep)
+            published = dataset.version
+            print(
+                f"Published {len(dataset.frame):,} rows from {dataset.source} to {path}"
+                f" ({os.path.getsize(path) / 1024 ** 2:.1f} MB) in {time.time() - start_time:.2f}s"
+            )
+        if not args.watch:
+            break
+        time.sleep(args.watch)
+
+if __name__ == "__main__":
+    main()
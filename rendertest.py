@@ -1,142 +1,357 @@
-import argparse
-from playwright.sync_api import sync_playwright
-import asyncio
-import time
-import concurrent.futures
-import pandas as pd
-from datetime import datetime
-import statistics
-import random
-
-class StreamlitLoadTest:
-    def __init__(self, url="http://192.168.31.8:8501/"):
-        self.url = url
-        self.metrics = []
-        
-
-    def run_single_user_test(self, user_id):
-        with sync_playwright() as p:
-            # Create a new browser context for each user (isolated session)
-            browser = p.chromium.launch(headless=True)
-            context = browser.new_context()
-            page = context.new_page()
-            page.set_default_timeout(0)  # Applies to all actions
-            page.set_default_navigation_timeout(0)  # For navigation-specific timeouts
-
-            metrics = {'user_id': user_id}
-            
-            try:
-                # Measure navigation time
-                start_time = time.time()
-                response = page.goto(self.url)
-                navigation_time = time.time() - start_time
-                
-                # Wait for main content
-                page.wait_for_selector("h1:has-text('Claim Report Dashboard Testing')")
-                render_time = time.time() - start_time
-                
-                # Simulate unique user behavior
-                filter_start = time.time()
-               
-                page.wait_for_selector("text=Filtered Claims Statistics")
-                
-                filter_time = time.time() - filter_start
-                
-                # Get performance metrics
-                perf_metrics = page.evaluate("""() => {
-                    const timing = window.performance.timing;
-                    return {
-                        ttfb: timing.responseStart - timing.navigationStart,
-                        fcp: performance.getEntriesByName('first-contentful-paint')[0]?.startTime,
-                        tti: timing.domInteractive - timing.navigationStart
-                    }
-                }""")
-                
-                metrics.update({
-                    'timestamp': datetime.now(),
-                    'navigation_time': navigation_time,
-                    'render_time': render_time,
-                    'filter_time': filter_time,
-                    'ttfb': perf_metrics['ttfb'],
-                    'fcp': perf_metrics['fcp'],
-                    'tti': perf_metrics['tti'],
-                    'status_code': response.status if response else None,
-                   
-                })
-            
-            except Exception as e:
-                print(f"Error for user {user_id}: {str(e)}")
-                metrics.update({
-                    'timestamp': datetime.now(),
-                    'error': str(e),
-                    'status_code': 500
-                })
-            
-            finally:
-                context.close()
-                browser.close()
-                
-            return metrics
-
-    def run_concurrent_users(self, num_users=3):
-        with concurrent.futures.ThreadPoolExecutor(max_workers=num_users) as executor:
-            futures = [executor.submit(self.run_single_user_test, f"user_{i}") 
-                      for i in range(num_users)]
-            results = [f.result() for f in futures]
-            self.metrics.extend(results)
-
-    def generate_report(self):
-        df = pd.DataFrame(self.metrics)
-        
-        report = {
-            'Total Users': len(df),
-            'Unique Users': df['user_id'].nunique(),
-            'Avg Navigation Time': statistics.mean(df['navigation_time']),
-            'Avg Render Time': statistics.mean(df['render_time']),
-            'Avg Filter Time': statistics.mean(df['filter_time']),
-            'Avg TTFB': statistics.mean(df['ttfb']),
-            'Avg FCP': statistics.mean(df['fcp']),
-            'Avg TTI': statistics.mean(df['tti']),
-            '95th Percentile Render Time': df['render_time'].quantile(0.95),
-            'Success Rate': (df['status_code'] == 200).mean() * 100
-        }
-        
-        # Add user behavior analysis
-        if 'claim_number' in df.columns:
-            report['Unique Claim Numbers'] = df['claim_number'].nunique()
-            report['Most Common System'] = df['system'].mode().iloc[0]
-        
-        return report
-
-def parse_arguments():
-    parser = argparse.ArgumentParser(description='Run load test for Streamlit application')
-    parser.add_argument(
-        '--users', 
-        type=int,
-        default=10,
-        help='Number of concurrent users to simulate (default: 10)'
-    )
-    return parser.parse_args()
-
-def main():
-    args = parse_arguments()
-    
-    if args.users < 1:
-        print("Error: Number of users must be at least 1")
-        return
-        
-    load_test = StreamlitLoadTest()
-    
-    print(f"Starting load test with {args.users} concurrent users...")
-    load_test.run_concurrent_users(num_users=args.users)
-    
-    print("\nTest Results:")
-    report = load_test.generate_report()
-    for metric, value in report.items():
-        if isinstance(value, (int, float)):
-            print(f"{metric}: {value:.2f}")
-        else:
-            print(f"{metric}: {value}")
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+import numpy as np
+import pandas as pd
+from playwright.async_api import async_playwright
+
+DEFAULT_URL = "http://localhost:8501/"
+
+# How often the load profile is re-evaluated to start or stop users
+PROFILE_TICK_SECONDS = 0.5
+
+# Streamlit shows this widget while a script run is in progress
+STATUS_WIDGET = '[data-testid="stStatusWidget"]'
+EXCEPTION_ELEMENT = '[data-testid="stException"]'
+
+# Values the scripted filters pick from; they exist in Claims.csv and in the
+# extracts generate_claims.py writes
+FILTER_VALUES = {
+    'claim_status': ['Open', 'Closed', 'Reopened'],
+    'line_of_business': ['Motor', 'Home', 'Commercial', 'Travel'],
+    'source_system': ['Guidewire', 'Portal', 'Legacy'],
+}
+CLAIM_NUMBER_RANGE = (100000, 104999)
+
+PERCENTILES = [50, 95, 99]
+
+
+class DashboardError(Exception):
+    pass
+
+
+# Wait for the script run started by the last action to finish. Fast reruns may
+# be over before the status widget is seen, so its appearance is optional.
+async def wait_for_rerun(page):
+    try:
+        await page.wait_for_selector(STATUS_WIDGET, state='attached', timeout=1000)
+    except Exception:
+        pass
+    await page.wait_for_selector(STATUS_WIDGET, state='detached')
+    if await page.locator(EXCEPTION_ELEMENT).count():
+        raise DashboardError((await page.locator(EXCEPTION_ELEMENT).first.inner_text()).splitlines()[0])
+
+
+async def open_dashboard(page, url, params=None):
+    target = f"{url}?{urlencode(params)}" if params else url
+    response = await page.goto(target)
+    if response is not None and response.status >= 400:
+        raise DashboardError(f"HTTP {response.status}")
+    await page.wait_for_selector("text=Total Claims")
+    await wait_for_rerun(page)
+
+
+# Scripted interactions: async callables (page, url). Sidebar filters are applied
+# by opening the dashboard with them as query parameters, which the app reads when
+# a session starts; the claim number search types into the sidebar of the open session.
+def filtered_open(col):
+    async def interaction(page, url):
+        await open_dashboard(page, url, {col: random.choice(FILTER_VALUES[col])})
+    return interaction
+
+
+async def search_claim_number(page, url):
+    box = page.get_by_label("Filter by Claim Number (comma-separated)")
+    await box.fill(f"CLM{random.randint(*CLAIM_NUMBER_RANGE)}")
+    await box.press("Enter")
+    await wait_for_rerun(page)
+
+
+async def clear_claim_number(page, url):
+    box = page.get_by_label("Filter by Claim Number (comma-separated)")
+    await box.fill("")
+    await box.press("Enter")
+    await wait_for_rerun(page)
+
+
+INTERACTIONS = {
+    'open_dashboard': open_dashboard,
+    'filter_claim_status': filtered_open('claim_status'),
+    'filter_line_of_business': filtered_open('line_of_business'),
+    'filter_source_system': filtered_open('source_system'),
+    'search_claim_number': search_claim_number,
+    'clear_claim_number': clear_claim_number,
+}
+
+# Interaction sequences a virtual user repeats
+SCENARIOS = {
+    'browse': ['open_dashboard', 'search_claim_number', 'clear_claim_number', 'filter_claim_status',
+               'filter_line_of_business'],
+    'filters': ['filter_claim_status', 'filter_line_of_business', 'filter_source_system'],
+    'open': ['open_dashboard'],
+}
+
+
+# Concurrent users over time. steady holds `users` for the whole run; ramp grows
+# linearly from 1 to `users` over ramp_seconds and then holds; spike holds
+# `users` and jumps to spike_users for spike_seconds from a third of the way in.
+class LoadProfile:
+    def __init__(self, name, users, duration, ramp_seconds=0.0, spike_users=0, spike_seconds=0.0):
+        self.name = name
+        self.users = users
+        self.duration = duration
+        self.ramp_seconds = ramp_seconds
+        self.spike_users = spike_users
+        self.spike_seconds = spike_seconds
+
+    def users_at(self, elapsed):
+        if self.name == 'ramp' and elapsed < self.ramp_seconds:
+            return 1 + int((self.users - 1) * elapsed / self.ramp_seconds)
+        if self.name == 'spike':
+            spike_start = self.duration / 3
+            if spike_start <= elapsed < spike_start + self.spike_seconds:
+                return self.spike_users
+        return self.users
+
+
+class StreamlitLoadTest:
+    def __init__(self, url=DEFAULT_URL, scenario='browse', think_time=1.0, timeout=60.0, headless=True):
+        self.url = url
+        self.scenario = SCENARIOS[scenario]
+        self.think_time = think_time
+        self.timeout = timeout
+        self.headless = headless
+        self.metrics = []
+        self.concurrency = []
+        self.started = None
+        self.elapsed = 0.0
+
+    async def timed_interaction(self, page, user_id, name):
+        sample = {'user_id': user_id, 'interaction': name, 'start_offset': time.perf_counter() - self.started}
+        start = time.perf_counter()
+        try:
+            await INTERACTIONS[name](page, self.url)
+            sample.update({'ok': True, 'error_type': None, 'error': None})
+        except Exception as e:
+            sample.update({'ok': False, 'error_type': type(e).__name__, 'error': str(e).splitlines()[0][:200]})
+        sample['seconds'] = time.perf_counter() - start
+        sample['timestamp'] = datetime.now().isoformat()
+        self.metrics.append(sample)
+        return sample['ok']
+
+    # One virtual user: an isolated context on the shared browser running the
+    # scenario until told to stop. A failed interaction restarts the scenario.
+    async def run_user(self, browser, user_id, stop):
+        context = await browser.new_context()
+        page = await context.new_page()
+        page.set_default_timeout(self.timeout * 1000)
+        page.set_default_navigation_timeout(self.timeout * 1000)
+        try:
+            while not stop.is_set():
+                for name in self.scenario:
+                    if stop.is_set() or not await self.timed_interaction(page, user_id, name):
+                        break
+                    await asyncio.sleep(random.uniform(0, self.think_time))
+        finally:
+            await context.close()
+
+    # Run the profile against the dashboard with one browser shared by every user
+    async def run(self, profile):
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=self.headless)
+            self.started = time.perf_counter()
+            users = []
+            next_user = 0
+            try:
+                while (elapsed := time.perf_counter() - self.started) < profile.duration:
+                    users = [(task, stop) for task, stop in users if not task.done()]
+                    active = [(task, stop) for task, stop in users if not stop.is_set()]
+                    target = profile.users_at(elapsed)
+                    for _ in range(target - len(active)):
+                        stop = asyncio.Event()
+                        task = asyncio.create_task(self.run_user(browser, f"user_{next_user}", stop))
+                        users.append((task, stop))
+                        next_user += 1
+                    for _, stop in active[target:]:
+                        stop.set()
+                    self.concurrency.append({'elapsed': elapsed, 'users': target})
+                    await asyncio.sleep(PROFILE_TICK_SECONDS)
+            finally:
+                for _, stop in users:
+                    stop.set()
+                await asyncio.gather(*(task for task, _ in users), return_exceptions=True)
+                self.elapsed = time.perf_counter() - self.started
+                await browser.close()
+
+    # Latency percentiles over successful samples, throughput and errors per
+    # interaction. Interactions that never succeeded report no latencies.
+    def generate_report(self):
+        df = pd.DataFrame(self.metrics, columns=['user_id', 'interaction', 'ok', 'seconds', 'error_type'])
+        elapsed = self.elapsed or 1.0
+        interactions = {}
+        for name, samples in df.groupby('interaction', sort=False):
+            latencies = samples.loc[samples['ok'], 'seconds'].to_numpy(dtype=float)
+            summary = {
+                'count': len(samples),
+                'errors': int((~samples['ok']).sum()),
+                'throughput_per_s': len(latencies) / elapsed,
+            }
+            for q in PERCENTILES:
+                summary[f'p{q}_s'] = float(np.percentile(latencies, q)) if len(latencies) else None
+            summary['mean_s'] = float(latencies.mean()) if len(latencies) else None
+            summary['error_types'] = samples['error_type'].dropna().value_counts().to_dict()
+            interactions[name] = summary
+
+        peak_users = max((point['users'] for point in self.concurrency), default=0)
+        return {
+            'url': self.url,
+            'duration_s': elapsed,
+            'users_started': df['user_id'].nunique(),
+            'peak_users': peak_users,
+            'interactions': len(df),
+            'errors': int((~df['ok'].astype(bool)).sum()),
+            'throughput_per_s': int(df['ok'].astype(bool).sum()) / elapsed,
+            'error_types': df['error_type'].dropna().value_counts().to_dict(),
+            'per_interaction': interactions,
+        }
+
+    # Samples as CSV and the report (with its settings) as JSON
+    def write_results(self, prefix, report, settings):
+        pd.DataFrame(self.metrics).to_csv(f"{prefix}.csv", index=False)
+        with open(f"{prefix}.json", 'w') as f:
+            json.dump({'settings': settings, **report}, f, indent=2, default=str)
+
+
+def print_report(report, previous=None):
+    print(f"Duration: {report['duration_s']:.1f}s, users started: {report['users_started']},"
+          f" peak concurrent: {report['peak_users']}")
+    print(f"Interactions: {report['interactions']} ({report['errors']} errors),"
+          f" throughput {report['throughput_per_s']:.2f}/s")
+    for error_type, count in report['error_types'].items():
+        print(f"  {error_type}: {count}")
+
+    print(f"\n{'interaction':<26}{'count':>7}{'errors':>8}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}")
+    for name, summary in report['per_interaction'].items():
+        cells = "".join(
+            f"{summary[f'p{q}_s']:>9.3f}" if summary[f'p{q}_s'] is not None else f"{'-':>9}" for q in PERCENTILES
+        )
+        line = f"{name:<26}{summary['count']:>7}{summary['errors']:>8}{cells}"
+        before = (previous or {}).get('per_interaction', {}).get(name, {}).get('p95_s')
+        if before and summary['p95_s'] is not None:
+            line += f"  p95 {summary['p95_s'] / before:.2f}x previous"
+        print(line)
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Run load test for Streamlit application')
+    parser.add_argument(
+        '--url',
+        default=DEFAULT_URL,
+        help=f'Dashboard URL (default: {DEFAULT_URL})'
+    )
+    parser.add_argument(
+        '--users',
+        type=int,
+        default=10,
+        help='Concurrent users to hold once ramped up (default: 10)'
+    )
+    parser.add_argument(
+        '--profile',
+        choices=['steady', 'ramp', 'spike'],
+        default='steady',
+        help='How the number of users changes over the run (default: steady)'
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=60.0,
+        help='Length of the run in seconds (default: 60)'
+    )
+    parser.add_argument(
+        '--ramp-seconds',
+        type=float,
+        default=30.0,
+        help='Time to reach --users with the ramp profile (default: 30)'
+    )
+    parser.add_argument(
+        '--spike-users',
+        type=int,
+        default=None,
+        help='Users during the spike of the spike profile (default: 3 x --users)'
+    )
+    parser.add_argument(
+        '--spike-seconds',
+        type=float,
+        default=10.0,
+        help='Length of the spike (default: 10)'
+    )
+    parser.add_argument(
+        '--scenario',
+        choices=list(SCENARIOS),
+        default='browse',
+        help='Interactions each user repeats (default: browse)'
+    )
+    parser.add_argument(
+        '--think-time',
+        type=float,
+        default=1.0,
+        help='Maximum random pause between interactions in seconds (default: 1)'
+    )
+    parser.add_argument(
+        '--timeout',
+        type=float,
+        default=60.0,
+        help='Seconds before an interaction counts as failed (default: 60)'
+    )
+    parser.add_argument(
+        '--output',
+        default=None,
+        help='Prefix of the samples CSV and report JSON (default: loadtest_<time>)'
+    )
+    parser.add_argument(
+        '--compare',
+        default=None,
+        help='Report JSON of an earlier run to compare p95 latencies with'
+    )
+    parser.add_argument(
+        '--headed',
+        action='store_true',
+        help='Show the browser windows'
+    )
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+
+    if args.users < 1:
+        print("Error: Number of users must be at least 1")
+        return
+
+    profile = LoadProfile(
+        args.profile, args.users, args.duration, args.ramp_seconds,
+        args.spike_users or 3 * args.users, args.spike_seconds
+    )
+    load_test = StreamlitLoadTest(args.url, args.scenario, args.think_time, args.timeout, not args.headed)
+
+    print(f"Starting {args.profile} load test against {args.url} with {args.users} users for {args.duration:.0f}s...")
+    asyncio.run(load_test.run(profile))
+
+    print("\nTest Results:")
+    report = load_test.generate_report()
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+    print_report(report, previous)
+
+    prefix = args.output or f"loadtest_{datetime.now():%Y%m%d_%H%M%S}"
+    load_test.write_results(prefix, report, vars(args))
+    print(f"\nWrote {prefix}.csv and {prefix}.json")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from claims_aggregates import ClaimsCube, KpiEngine, compute_chart_aggregates, kpi_values
+from claims_data import FILTER_DATE_COLUMNS, apply_claims_schema
+from claims_filters import ClaimsFilterEngine, FilterState
+from generate_claims import generate_claims
+
+ROWS = 4000
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return apply_claims_schema(generate_claims(ROWS, seed=8))
+
+
+# States the cube answers: a received date range, ranges spanning the whole
+# column for the other date filters (the sidebar default) and any text filters
+def cube_states(frame):
+    bounds = {col: (frame[col].min(), frame[col].max()) for col in FILTER_DATE_COLUMNS}
+    low, high = bounds['claim_received_date']
+    middle = (low + (high - low) / 2).normalize()
+    ranges = [bounds['claim_received_date'], (low, middle), (middle, middle), (middle + pd.Timedelta(days=1), middle)]
+    text_filters = [
+        {},
+        {'claim_status': ['Open']},
+        {'claim_status': ['Open', 'Reopened'], 'line_of_business': ['Motor', 'Home']},
+        {'claim_status': []},
+    ]
+    return [
+        FilterState(text_filters=filters, date_ranges={**bounds, 'claim_received_date': received})
+        for received in ranges for filters in text_filters
+    ]
+
+
+# Chart aggregates with the same rows in key order and plain values, so the
+# cube's categoricals and the row-level frames compare equal
+def comparable(aggregates):
+    keys = {
+        'status_counts': ['claim_status'],
+        'line_of_business_counts': ['line_of_business'],
+        'claims_over_time': ['claim_received_date'],
+        'monthly_status_counts': ['month_year', 'claim_status'],
+        'monthly_totals': ['month_year'],
+    }
+    result = {}
+    for name, columns in keys.items():
+        values = aggregates[name].astype({col: str for col in columns if col != 'claim_received_date'})
+        result[name] = values.sort_values(columns).reset_index(drop=True).astype({values.columns[-1]: 'int64'})
+    return result
+
+
+def test_cube_rollup_matches_row_level_aggregation(frame):
+    cube, engine = ClaimsCube(frame), ClaimsFilterEngine(frame)
+    for state in cube_states(frame):
+        assert cube.answers(state)
+        expected = comparable(compute_chart_aggregates(frame.take(engine.select(state))))
+        actual = comparable(cube.rollup(state))
+        for name in expected:
+            pd.testing.assert_frame_equal(actual[name], expected[name], check_dtype=False)
+
+
+def test_cube_does_not_answer_row_level_states(frame):
+    cube = ClaimsCube(frame)
+    bounds = {col: (frame[col].min(), frame[col].max()) for col in FILTER_DATE_COLUMNS}
+    loss_low, loss_high = bounds['claim_loss_date']
+    assert not cube.answers(FilterState(claim_numbers=['CLM100001'], date_ranges=bounds))
+    assert not cube.answers(FilterState(date_ranges={**bounds, 'claim_loss_date': (loss_low + pd.Timedelta(days=1), loss_high)}))
+    assert not cube.answers(FilterState())
+
+
+# The KPIs summed row by row from the frame
+def reference_kpis(frame, rows):
+    selected = frame.take(rows)
+    opportunity = selected['leakage_opportunity'].fillna(False).to_numpy(dtype=bool)
+    actioned = selected['opportunity_actioned'].fillna(False).to_numpy(dtype=bool)
+    totals = [
+        len(selected),
+        opportunity.sum(),
+        (opportunity & ~actioned).sum(),
+        selected['potential_leakage_amount'].fillna(0).sum(),
+        selected['incurred_amount'].fillna(0).sum(),
+    ]
+    return kpi_values(totals, frame.columns)
+
+
+def test_kpis_match_row_level_sums(frame):
+    kpis, engine = KpiEngine(frame), ClaimsFilterEngine(frame)
+    states = cube_states(frame) + [FilterState(claim_numbers=['CLM1001*']), FilterState(claim_numbers=['UNKNOWN'])]
+    for state in states:
+        rows = engine.select(state)
+        assert kpis.compute(rows) == pytest.approx(reference_kpis(frame, rows))
+
+    # Every row, as None and as positions, takes the precomputed totals
+    every_row = np.arange(len(frame))
+    assert kpis.compute(None) == pytest.approx(reference_kpis(frame, every_row))
+    assert kpis.compute(every_row) == pytest.approx(reference_kpis(frame, every_row))
+
+
+def test_kpis_without_source_columns(frame):
+    reduced = frame.drop(columns=['leakage_opportunity', 'potential_leakage_amount'])
+    values = KpiEngine(reduced).compute(np.arange(10))
+    assert values['claims_monitored'] == 10
+    assert values['leakage_opportunities'] is None
+    assert values['potential_leakage'] is None
+    assert values['leakage_rate_pct'] is None
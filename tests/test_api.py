@@ -0,0 +1,33 @@
+import pytest
+
+import claims_api
+import claims_data
+from claims_api import PopularViews, api_rows
+from claims_sources import DatasetSource
+from generate_claims import generate_claims
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setattr(claims_data, '_dataset', None)
+    monkeypatch.setattr(claims_api, 'popular_views', PopularViews(path=None))
+    path = tmp_path / 'Claims.csv'
+    generate_claims(500, seed=4).to_csv(path, index=False)
+    return DatasetSource(str(path), delta_source='', refresh_seconds=0, shared_dir='')
+
+
+@pytest.mark.parametrize('query', [
+    {'claim_status': ['Open'], 'start': ['ten']},
+    {'claim_status': ['Open'], 'stop': ['']},
+    {'claim_status': ['Open'], 'sort': ['no_such_column']},
+])
+def test_invalid_rows_request_is_not_recorded(source, query):
+    with pytest.raises(ValueError):
+        api_rows(source, query)
+    assert claims_api.popular_views.top(10) == []
+
+
+def test_rows_request_is_recorded(source):
+    body = api_rows(source, {'claim_status': ['Open'], 'sort': ['incurred_amount'], 'stop': ['5']})
+    assert len(body['rows']) == 5
+    assert [requests for _, requests in claims_api.popular_views.top(10)] == [1]
@@ -0,0 +1,42 @@
+import numpy as np
+
+from claims_cache import LruCache
+
+
+def test_entry_bound_drops_least_recently_used():
+    cache = LruCache(max_entries=2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    assert cache.get('a') == 1
+    cache.put('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_bound_counts_value_sizes():
+    cache = LruCache(max_bytes=100, size=lambda values: values.nbytes)
+    cache.put('a', np.zeros(5))
+    cache.put('b', np.zeros(5))
+    cache.put('a', np.zeros(4))
+    assert cache.stats()['bytes'] == 72
+    cache.put('c', np.zeros(5))
+    assert cache.get('b') is None
+    assert cache.stats()['bytes'] == 72
+
+    # Too large to keep at all; the cache is left as it was
+    assert cache.get_or_compute('d', lambda: np.zeros(20)).nbytes == 160
+    assert cache.get('d') is None
+    assert cache.stats()['entries'] == 2
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('claims_cache.time.monotonic', lambda: now[0])
+    cache = LruCache(ttl_seconds=60, max_bytes=10)
+    cache.put('a', 'xyz')
+    now[0] += 59
+    assert cache.get('a') == 'xyz'
+    now[0] += 2
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 0
@@ -0,0 +1,189 @@
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from claims_data import FILTER_DATE_COLUMNS, TEXT_FILTER_COLUMNS, apply_claims_schema
+from claims_filters import ClaimNumberIndex, ClaimsFilterEngine, FilterState, IncrementalSelection
+from generate_claims import generate_claims
+
+ROWS = 3000
+
+
+@pytest.fixture(scope='module')
+def frame():
+    return apply_claims_schema(generate_claims(ROWS, seed=7))
+
+
+@pytest.fixture(scope='module')
+def engine(frame):
+    return ClaimsFilterEngine(frame)
+
+
+# Rows matching a state with plain pandas masks, as the dashboard filtered before
+# the engine; skip leaves one text filter out, as facet counts do for their column
+def reference_rows(frame, state, skip=None):
+    mask = pd.Series(True, index=frame.index)
+    if state.claim_numbers:
+        numbers = frame['claim_number'].astype(object)
+        matches = numbers.isin([number for number in state.claim_numbers if not number.endswith('*')])
+        for number in state.claim_numbers:
+            if number.endswith('*'):
+                matches |= numbers.str.startswith(number[:-1]).fillna(False).astype(bool)
+        mask &= matches
+    for col, values in state.text_filters.items():
+        if col != skip:
+            mask &= frame[col].isin(values)
+    for col, (start, end) in state.date_ranges.items():
+        mask &= frame[col].between(start, end)
+    return np.flatnonzero(mask.to_numpy())
+
+
+def reference_facets(frame, state):
+    counts = {}
+    for col in TEXT_FILTER_COLUMNS:
+        values = frame[col].take(reference_rows(frame, state, skip=col)).value_counts()
+        counts[col] = {value: int(count) for value, count in values.items() if count}
+    return counts
+
+
+def random_state(frame, rng):
+    text_filters = {}
+    for col in TEXT_FILTER_COLUMNS:
+        if rng.random() < 0.4:
+            options = list(frame[col].dropna().unique())
+            text_filters[col] = rng.sample(options, rng.randint(1, min(3, len(options))))
+    date_ranges = {}
+    for col in FILTER_DATE_COLUMNS:
+        if rng.random() < 0.4:
+            low, high = frame[col].min(), frame[col].max()
+            start = (low + (high - low) * rng.random()).normalize()
+            date_ranges[col] = (start, (start + (high - low) * rng.random() / 2).normalize())
+    claim_numbers = []
+    if rng.random() < 0.3:
+        claim_numbers = [frame['claim_number'].iloc[rng.randrange(len(frame))] for _ in range(3)]
+        claim_numbers += rng.sample(['CLM1001*', 'CLM10*', 'UNKNOWN', 'CLM999999', 'ZZ*'], 2)
+    return FilterState(claim_numbers, text_filters, date_ranges)
+
+
+def edge_states(frame):
+    first = frame['claim_received_date'].min()
+    return [
+        FilterState(),
+        FilterState(text_filters={'claim_status': []}),
+        FilterState(claim_numbers=['UNKNOWN', 'CLM999999']),
+        FilterState(claim_numbers=['UNKNOWN', frame['claim_number'].iloc[5]]),
+        FilterState(claim_numbers=['CLM1002*'], text_filters={'claim_status': ['Open']}),
+        FilterState(date_ranges={'claim_received_date': (first, first)}),
+        FilterState(date_ranges={'claim_received_date': (first + pd.Timedelta(days=30), first)}),
+        FilterState(text_filters={'claim_status': ['Reopened'], 'fault_rating': ['Unknown'], 'source_system': ['Legacy']}),
+    ]
+
+
+def test_select_matches_pandas_masks(frame, engine):
+    rng = random.Random(0)
+    for state in edge_states(frame) + [random_state(frame, rng) for _ in range(100)]:
+        np.testing.assert_array_equal(engine.select(state), reference_rows(frame, state))
+
+
+def test_facet_counts_match_pandas_masks(frame, engine):
+    rng = random.Random(1)
+    for state in edge_states(frame) + [random_state(frame, rng) for _ in range(40)]:
+        counts = engine.facet_counts(state)
+        nonzero = {col: {value: count for value, count in values.items() if count} for col, values in counts.items()}
+        assert nonzero == reference_facets(frame, state)
+
+
+# Claim numbers with duplicates, a missing value, and numbers that are prefixes
+# of one another
+@pytest.fixture
+def claim_numbers():
+    numbers = ['CLM3', 'CLM1', None, 'CLM12', 'CLM1', 'CLM2', 'CLM120', 'clm1', 'CLM12']
+    return pd.Series(numbers, dtype='str')
+
+
+def reference_find(claim_numbers, wanted):
+    return reference_rows(pd.DataFrame({'claim_number': claim_numbers}), FilterState(wanted))
+
+
+@pytest.mark.parametrize('wanted', [
+    ['CLM1'],
+    ['CLM12', 'CLM3'],
+    ['UNKNOWN'],
+    ['UNKNOWN', 'CLM2'],
+    ['CLM1*'],
+    ['CLM12*', 'CLM3'],
+    ['CLM1*', 'CLM12'],
+    ['*'],
+    ['ZZ*', 'clm*'],
+])
+def test_claim_number_find_matches_pandas(claim_numbers, wanted):
+    index = ClaimNumberIndex(claim_numbers)
+    np.testing.assert_array_equal(index.find(wanted), reference_find(claim_numbers, wanted))
+
+
+def test_claim_number_lookup_returns_every_copy(claim_numbers):
+    which, positions = ClaimNumberIndex(claim_numbers).lookup(['CLM12', 'UNKNOWN', 'CLM1'])
+    assert sorted(zip(which.tolist(), positions.tolist())) == [(0, 3), (0, 8), (2, 1), (2, 4)]
+
+
+def test_extended_index_matches_a_rebuilt_one(claim_numbers):
+    added = pd.Series(['CLM11', None, 'CLM0', 'CLM121'], dtype='str')
+    extended = ClaimNumberIndex(claim_numbers).extended(added, np.arange(len(claim_numbers), len(claim_numbers) + 4))
+    combined = pd.concat([claim_numbers, added], ignore_index=True)
+    for wanted in [['CLM12*'], ['CLM0', 'CLM11'], ['CLM*'], ['CLM121', 'UNKNOWN']]:
+        np.testing.assert_array_equal(extended.find(wanted), reference_find(combined, wanted))
+
+
+def test_incremental_narrow_widen_narrow(frame, engine):
+    low, high = frame['claim_loss_date'].min(), frame['claim_loss_date'].max()
+    middle = (low + (high - low) / 2).normalize()
+    statuses = {'claim_status': ['Open', 'Closed']}
+    states = [
+        FilterState(),
+        FilterState(text_filters=statuses),
+        FilterState(text_filters={'claim_status': ['Open']}),
+        FilterState(text_filters={**statuses, 'line_of_business': ['Motor']}),
+        FilterState(text_filters=statuses, date_ranges={'claim_loss_date': (low, high)}),
+        FilterState(text_filters=statuses, date_ranges={'claim_loss_date': (low, middle)}),
+        FilterState(text_filters=statuses, date_ranges={'claim_loss_date': (middle, middle)}),
+        FilterState(text_filters=statuses, date_ranges={'claim_loss_date': (low, high)}),
+        FilterState(text_filters={'claim_status': []}),
+        FilterState(claim_numbers=['UNKNOWN']),
+        FilterState(claim_numbers=['UNKNOWN', 'CLM10*'], text_filters=statuses),
+        FilterState(claim_numbers=['CLM10*'], text_filters=statuses),
+        FilterState(claim_numbers=['CLM100*'], text_filters=statuses),
+        FilterState(),
+        FilterState(),
+    ]
+    selection = IncrementalSelection(engine)
+    for state in states:
+        np.testing.assert_array_equal(selection.select(state), reference_rows(frame, state))
+
+
+def test_incremental_random_walk(frame, engine):
+    rng = random.Random(2)
+    selection = IncrementalSelection(engine)
+    state = FilterState()
+    for _ in range(150):
+        # Change one filter at a time, as the sidebar does
+        changed = random_state(frame, rng)
+        name = rng.choice(['claim_numbers', 'text_filters', 'date_ranges'])
+        if name == 'claim_numbers':
+            state = FilterState(changed.claim_numbers, state.text_filters, state.date_ranges)
+        elif name == 'text_filters':
+            col = rng.choice(TEXT_FILTER_COLUMNS)
+            text_filters = dict(state.text_filters)
+            text_filters.pop(col, None)
+            if col in changed.text_filters:
+                text_filters[col] = changed.text_filters[col]
+            state = FilterState(state.claim_numbers, text_filters, state.date_ranges)
+        else:
+            col = rng.choice(FILTER_DATE_COLUMNS)
+            date_ranges = dict(state.date_ranges)
+            date_ranges.pop(col, None)
+            if col in changed.date_ranges:
+                date_ranges[col] = changed.date_ranges[col]
+            state = FilterState(state.claim_numbers, state.text_filters, date_ranges)
+        np.testing.assert_array_equal(selection.select(state), reference_rows(frame, state))
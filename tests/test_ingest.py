@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from claims_data import DATE_COLUMNS, read_claims_csv, read_claims_csv_parallel
+from generate_claims import generate_claims
+
+ROWS = 300
+
+
+# Extract with day-first dates whose first value also reads month-first, so a
+# chunk that guessed its own format would parse it differently
+@pytest.fixture
+def day_first_csv(tmp_path):
+    frame = generate_claims(ROWS, seed=5)
+    for col in DATE_COLUMNS:
+        frame[col] = frame[col].dt.strftime('%d/%m/%Y')
+        frame.loc[0, col] = '03/04/2022'
+    path = tmp_path / 'Claims.csv'
+    frame.to_csv(path, index=False)
+    return str(path)
+
+
+def test_chunk_size_does_not_change_the_frame(day_first_csv):
+    expected = read_claims_csv(day_first_csv, chunk_rows=ROWS)
+    pd.testing.assert_frame_equal(read_claims_csv(day_first_csv, chunk_rows=7), expected)
+
+    # Parsed as a whole column would be: the format comes from the first value
+    raw = pd.read_csv(day_first_csv, dtype=str)
+    for col in DATE_COLUMNS:
+        parsed = pd.to_datetime(raw[col], errors='coerce').astype(expected[col].dtype)
+        pd.testing.assert_series_equal(expected[col], parsed, check_names=False)
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_parallel_load_matches_the_serial_one(day_first_csv, workers):
+    expected = read_claims_csv(day_first_csv)
+    pd.testing.assert_frame_equal(read_claims_csv_parallel(day_first_csv, workers), expected)
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import claims_data
+from claims_aggregates import get_claims_cube, get_kpi_engine, get_month_year
+from claims_data import ClaimsDataset, get_claims_dataset
+from claims_filters import FilterState, get_filter_engine
+from claims_refresh import refresh_claims_dataset
+from claims_sources import DatasetSource
+from generate_claims import generate_claims
+
+ROWS = 3000
+
+
+@pytest.fixture
+def claims_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(claims_data, '_dataset', None)
+    path = tmp_path / 'Claims.csv'
+    generate_claims(ROWS, seed=1).to_csv(path, index=False)
+    return str(path)
+
+
+# Changed copies of existing claims (one with a status never seen before), older
+# rows that must be ignored, and new claims in a new line of business
+def make_delta(frame):
+    mark = frame['update_date'].max()
+    changed = frame.sample(200, random_state=1).copy()
+    changed['claim_status'] = np.where(np.arange(len(changed)) % 3 == 0, 'Withdrawn', 'Closed')
+    changed['claim_loss_date'] = changed['claim_loss_date'] - pd.Timedelta(days=40)
+    changed['potential_leakage_amount'] = 1.5
+    changed['update_date'] = mark + pd.Timedelta(days=1)
+    stale = frame.sample(50, random_state=2).copy()
+    stale['claim_status'] = 'Stale'
+    stale['update_date'] = pd.Timestamp('2000-01-01')
+    added = frame.sample(100, random_state=3).copy()
+    added['claim_number'] = [f'NEW{i:05d}' for i in range(len(added))]
+    added['line_of_business'] = 'Marine'
+    added['update_date'] = mark + pd.Timedelta(days=2)
+    return pd.concat([changed, stale, added], ignore_index=True)
+
+
+def sample_states(frame):
+    lo, hi = frame['claim_received_date'].min(), frame['claim_received_date'].max()
+    middle = lo + (hi - lo) / 2
+    return [
+        FilterState(),
+        FilterState(text_filters={'claim_status': ['Withdrawn', 'Open']}),
+        FilterState(text_filters={'line_of_business': ['Marine', 'Home'], 'claim_status': ['Closed']}),
+        FilterState(date_ranges={'claim_received_date': (lo.normalize(), middle.normalize())}),
+        FilterState(
+            text_filters={'source_system': ['Portal']},
+            date_ranges={'claim_loss_date': (lo.normalize(), hi.normalize())},
+        ),
+        FilterState(claim_numbers=['NEW00001', frame['claim_number'].iloc[0]]),
+    ]
+
+
+def sorted_frame(frame):
+    frame = frame.astype(str)
+    return frame.sort_values(list(frame.columns)).reset_index(drop=True)
+
+
+def test_refresh_patches_match_a_full_rebuild(claims_csv):
+    dataset = get_claims_dataset(claims_csv)
+    for build in (get_filter_engine, get_kpi_engine, get_claims_cube, get_month_year):
+        build(dataset)
+    delta = make_delta(dataset.frame)
+
+    patched, changed, added = refresh_claims_dataset(lambda since: delta[delta['update_date'] >= since])
+    assert (changed, added) == (200, 100)
+    assert {'filter_engine', 'kpi_engine', 'cube', 'month_year'} <= set(patched._derived)
+
+    rebuilt = ClaimsDataset(patched.frame.copy(), 'rebuilt', None, 0, 0.0)
+    patched_engine, rebuilt_engine = patched._derived['filter_engine'], get_filter_engine(rebuilt)
+    patched_kpis, rebuilt_kpis = patched._derived['kpi_engine'], get_kpi_engine(rebuilt)
+    patched_cube, rebuilt_cube = patched._derived['cube'], get_claims_cube(rebuilt)
+    for state in sample_states(patched.frame):
+        rows = patched_engine.select(state)
+        np.testing.assert_array_equal(rows, rebuilt_engine.select(state))
+        assert patched_engine.facet_counts(state) == rebuilt_engine.facet_counts(state)
+        assert patched_kpis.compute(rows) == pytest.approx(rebuilt_kpis.compute(rows))
+        assert patched_cube.answers(state) == rebuilt_cube.answers(state)
+        if rebuilt_cube.answers(state):
+            patched_rollup, rebuilt_rollup = patched_cube.rollup(state), rebuilt_cube.rollup(state)
+            assert set(patched_rollup) == set(rebuilt_rollup)
+            for name in rebuilt_rollup:
+                pd.testing.assert_frame_equal(sorted_frame(patched_rollup[name]), sorted_frame(rebuilt_rollup[name]))
+    pd.testing.assert_series_equal(
+        patched._derived['month_year'].astype(str), get_month_year(rebuilt).astype(str), check_names=False
+    )
+
+
+def test_failed_auto_refresh_keeps_the_current_version(claims_csv):
+    source = DatasetSource(claims_csv, delta_source='unreachable.csv', refresh_seconds=60, shared_dir='')
+    calls = []
+
+    def failing_read(since):
+        calls.append(since)
+        raise OSError('delta source unreachable')
+
+    source._read_delta = failing_read
+    dataset = source.dataset
+    assert len(calls) == 1
+    assert dataset is get_claims_dataset(claims_csv)
+    assert source.last_refresh is not None
+
+    # Not retried until the interval has passed
+    assert source.dataset is dataset
+    assert len(calls) == 1
+
+    source.last_refresh -= pd.Timedelta(seconds=61)
+    assert source.dataset is dataset
+    assert len(calls) == 2
+
+    # An explicit refresh reports the failure to the caller
+    with pytest.raises(OSError):
+        source.refresh()
@@ -0,0 +1,53 @@
+import tracemalloc
+
+import pandas as pd
+import pytest
+
+from claims_data import ClaimsDataset, apply_claims_schema
+from claims_filters import ClaimsSelection, FilterState, IncrementalSelection, get_filter_engine, sort_cache
+from claims_sources import DatasetView
+from generate_claims import generate_claims
+
+ROWS = 100_000
+
+# Peak allocation of one rerun over ROWS claims once the per-dataset indexes
+# exist. It grows with the selected rows, not with the columns of the frame.
+RERUN_ALLOC_BYTES = 3 * 1024 ** 2
+
+
+@pytest.fixture
+def dataset():
+    sort_cache.clear()
+    return ClaimsDataset(apply_claims_schema(generate_claims(ROWS, seed=2)), 'synthetic', None, 0, 0.0)
+
+
+# What the dashboard computes on a rerun, bypassing the shared aggregate cache:
+# the selection, counts, KPIs, facet counts, chart aggregates and a sorted page
+def rerun(dataset, state, session):
+    rows = session['selection'].select(state)
+    view = DatasetView(dataset, state, ClaimsSelection(dataset, rows))
+    view.counts()
+    view.kpis()
+    view.facet_counts()
+    view.chart_aggregates()
+    view.selection.sorted('incurred_amount', False).frame(stop=100)
+
+
+def test_rerun_peak_allocation(dataset):
+    loss_dates = dataset.frame['claim_loss_date']
+    # claim_loss_date is narrowed, so the charts are aggregated from rows, not the cube
+    state = FilterState(
+        text_filters={'claim_status': ['Open', 'Reopened']},
+        date_ranges={'claim_loss_date': (loss_dates.min(), loss_dates.min() + pd.Timedelta(days=730))},
+    )
+    session = {'selection': IncrementalSelection(get_filter_engine(dataset))}
+    rerun(dataset, state, session)
+    session['selection'] = IncrementalSelection(get_filter_engine(dataset))
+
+    tracemalloc.start()
+    try:
+        rerun(dataset, state, session)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak <= RERUN_ALLOC_BYTES, f"rerun peaked at {peak / 1024 ** 2:.1f} MB"
@@ -0,0 +1,90 @@
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import claims_data
+from claims_data import FILTER_DATE_COLUMNS, TEXT_FILTER_COLUMNS, read_claims_csv
+from claims_filters import FilterState
+from claims_sources import DatasetSource, SqlSource
+from generate_claims import generate_claims
+
+ROWS = 2000
+
+# Claim numbers holding LIKE wildcards. A prefix search must match them literally,
+# so CLM_1%* finds the first two and not CLMX1ZA.
+WILDCARD_CLAIMS = ['CLM_1%A', 'CLM_1%B', 'CLMX1ZA', 'CLM%1']
+
+
+# The same generated claims as a CSV-backed source and a SQLite-backed one. Rows
+# are in claim_number order, the tie-break of the SQL sort.
+@pytest.fixture
+def sources(tmp_path, monkeypatch):
+    monkeypatch.setattr(claims_data, '_dataset', None)
+    frame = generate_claims(ROWS, seed=6)
+    frame.loc[:len(WILDCARD_CLAIMS) - 1, 'claim_number'] = WILDCARD_CLAIMS
+    frame = frame.sort_values('claim_number').reset_index(drop=True)
+    csv_path = str(tmp_path / 'Claims.csv')
+    frame.to_csv(csv_path, index=False)
+
+    loaded = read_claims_csv(csv_path)
+    db_path = tmp_path / 'claims.db'
+    with sqlite3.connect(db_path) as conn:
+        loaded.astype({col: object for col in ['claim_number', *TEXT_FILTER_COLUMNS]}).to_sql(
+            'claim_details', conn, index=False
+        )
+    return DatasetSource(csv_path, delta_source='', refresh_seconds=0, shared_dir=''), SqlSource(f'sqlite:///{db_path}')
+
+
+def filter_states(source):
+    received = source.date_bounds('claim_received_date')
+    middle = received[0] + (received[1] - received[0]) / 2
+    frame = source.dataset.frame
+    return [
+        FilterState(),
+        FilterState(text_filters={'claim_status': ['Open', 'Reopened'], 'line_of_business': ['Motor']}),
+        FilterState(text_filters={'claim_status': []}),
+        FilterState(date_ranges={'claim_received_date': (received[0], middle.normalize())}),
+        FilterState(
+            text_filters={'source_system': ['Portal']},
+            date_ranges={
+                'claim_loss_date': source.date_bounds('claim_loss_date'),
+                'claim_received_date': (middle.normalize(), middle.normalize() + pd.Timedelta(days=90)),
+            },
+        ),
+        FilterState(claim_numbers=[frame['claim_number'].iloc[100], frame['claim_number'].iloc[200], 'CLM999999']),
+        FilterState(claim_numbers=['CLM_1%*']),
+        FilterState(claim_numbers=['CLM10*', 'CLM%1'], text_filters={'claim_status': ['Closed']}),
+    ]
+
+
+def plain(frame):
+    return frame.astype(object).where(frame.notna(), None).reset_index(drop=True)
+
+
+def test_sql_matches_in_memory(sources):
+    memory, sql = sources
+    assert sql.row_count == memory.row_count
+    for col in TEXT_FILTER_COLUMNS:
+        assert sql.filter_options(col) == sorted(memory.filter_options(col))
+    for col in FILTER_DATE_COLUMNS:
+        assert sql.date_bounds(col) == memory.date_bounds(col)
+
+    for state in filter_states(memory):
+        expected, actual = memory.view(state), sql.view(state)
+        assert actual.counts() == expected.counts()
+        assert actual.kpis() == pytest.approx(expected.kpis())
+        assert actual.facet_counts() == expected.facet_counts()
+        pd.testing.assert_frame_equal(plain(actual.page(0, 50)), plain(expected.page(0, 50)))
+        for col, ascending in [('claim_loss_date', True), ('incurred_amount', False), ('claim_status', False)]:
+            pd.testing.assert_frame_equal(
+                plain(actual.sorted(col, ascending).page(30, 80)),
+                plain(expected.sorted(col, ascending).page(30, 80)),
+            )
+
+
+def test_prefix_search_matches_wildcards_literally(sources):
+    memory, sql = sources
+    state = FilterState(claim_numbers=['CLM_1%*'])
+    assert list(sql.view(state).page(0, 10)['claim_number']) == ['CLM_1%A', 'CLM_1%B']
+    assert list(memory.view(state).page(0, 10)['claim_number']) == ['CLM_1%A', 'CLM_1%B']